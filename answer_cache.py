@@ -0,0 +1,110 @@
+# Persistent LLM answer cache keyed by model, question, retrieved context and conversation state
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from config import ANSWER_CACHE_MB, ANSWER_CACHE_TTL_HOURS, INDEX_DIR
+from query_cache import normalize_query
+from typing import List, Optional, Tuple
+
+ANSWER_CACHE_FILE = "answers.sqlite"
+
+_cache: Optional["AnswerCache"] = None
+_cache_lock = threading.Lock()
+
+
+def answer_key(model: str, query: str, *parts: str) -> str:
+    """Digest of the model tag, the normalized query and whatever else shaped the prompt.
+
+    parts carries the assembled code context (read from the files, so an edited
+    chunk gives a new key) and the conversation state the question continues.
+    """
+    h = hashlib.sha1()
+    for part in (model, normalize_query(query).casefold()) + parts:
+        h.update(part.encode("utf-8", "surrogatepass"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class AnswerCache:
+    """Answers (and the model state after them) in SQLite under INDEX_DIR, shared by all processes.
+
+    Entries older than ttl seconds are never returned and are purged on the next
+    write; past max_bytes the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl: float):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, model TEXT, query TEXT, answer TEXT,"
+            " state TEXT, size INTEGER, created REAL, used REAL)"
+        )
+        self.db.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, Optional[List[int]], float]]:
+        """(answer, state, created) for key, or None when missing or expired."""
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT answer, state, created FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[2] > self.ttl:
+                self.misses += 1
+                return None
+            self.db.execute("UPDATE answers SET used = ? WHERE key = ?", (now, key))
+            self.db.commit()
+            self.hits += 1
+        return row[0], json.loads(row[1]) if row[1] else None, row[2]
+
+    def put(self, key: str, model: str, query: str, answer: str, state: Optional[List[int]] = None):
+        now = time.time()
+        state_json = json.dumps(state) if state else None
+        size = len(answer.encode("utf-8")) + len(state_json or "")
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO answers (key, model, query, answer, state, size, created, used) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, query, answer, state_json, size, now, now),
+            )
+            self._evict(now)
+            self.db.commit()
+
+    def _evict(self, now: float):
+        self.db.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+        total = 0
+        stale = []
+        for key, size in self.db.execute("SELECT key, size FROM answers ORDER BY used DESC"):
+            total += size
+            if total > self.max_bytes:
+                stale.append((key,))
+        self.db.executemany("DELETE FROM answers WHERE key = ?", stale)
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM answers")
+            self.db.commit()
+
+    def stats(self) -> dict:
+        with self.lock:
+            count, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM answers").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "bytes": size, "max_bytes": self.max_bytes}
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Return the shared answer cache (None when ANSWER_CACHE_MB is 0)."""
+    global _cache
+    if ANSWER_CACHE_MB <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            os.makedirs(INDEX_DIR, exist_ok=True)
+            _cache = AnswerCache(
+                os.path.join(INDEX_DIR, ANSWER_CACHE_FILE), int(ANSWER_CACHE_MB * 1024 * 1024), ANSWER_CACHE_TTL_HOURS * 3600
+            )
+        return _cache
@@ -0,0 +1,113 @@
+# Startup benchmark: import time of the CLI and time until the prompt is shown
+#
+#   python3 bench_startup.py                 # median of 5 cold runs
+#   python3 bench_startup.py --warmup        # also time the background warm-up
+#   python3 bench_startup.py --imports 15    # slowest imports (python -X importtime)
+#   python3 bench_startup.py --json --budget 0.5   # machine-readable, exit 1 over budget
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# runs in a fresh interpreter: imports cli, then runs cli.main() with a prompt session
+# that records the time and exits instead of reading input
+_PROBE = r"""
+import sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import asyncio, json
+import cli
+t_import = time.perf_counter() - t0
+warmups = []
+if hasattr(cli, "Warmup"):
+    _start = cli.Warmup.start
+    def _capture(self):
+        warmups.append(self)
+        _start(self)
+    cli.Warmup.start = _capture
+result = {"import": t_import}
+class _Session:
+    def __init__(self):
+        # the CLI hooks its prefetcher to the prompt buffer, if it has one
+        from prompt_toolkit.buffer import Buffer
+        self.default_buffer = Buffer()
+    async def prompt_async(self, *args, **kwargs):
+        result["prompt"] = time.perf_counter() - t0
+        if sys.argv[2] == "1" and warmups:
+            warmups[0].wait()
+            result["warmup"] = warmups[0].elapsed
+        raise EOFError
+cli.PromptSession = _Session
+try:
+    asyncio.run(cli.main())
+except EOFError:
+    pass
+print("BENCH " + json.dumps(result), flush=True)
+"""
+
+
+def _run_once(warmup: bool) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-c", _PROBE, HERE, "1" if warmup else "0"],
+        cwd=os.getcwd(), capture_output=True, text=True,
+    )
+    for line in proc.stdout.splitlines():
+        if line.startswith("BENCH "):
+            return json.loads(line[6:])
+    raise RuntimeError(f"probe failed (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+
+
+def _slowest_imports(n: int):
+    """(cumulative seconds, module) of the n slowest modules imported directly by cli."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {HERE!r}); import cli"],
+        cwd=os.getcwd(), capture_output=True, text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        # nesting is shown by two spaces per level below the importing module
+        if len(name) - len(name.lstrip()) == 3:
+            rows.append((int(parts[1]) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure Diver's import time and time-to-prompt.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time (the median is reported)")
+    parser.add_argument("--warmup", action="store_true", help="also time the background index/model warm-up")
+    parser.add_argument("--imports", type=int, default=0, metavar="N", help="list the N slowest imports")
+    parser.add_argument("--json", action="store_true", help="print one JSON object")
+    parser.add_argument("--budget", type=float, default=None, help="exit 1 if the median time-to-prompt exceeds this (seconds)")
+    args = parser.parse_args(argv)
+
+    runs = [_run_once(args.warmup) for _ in range(max(1, args.runs))]
+    report = {key: statistics.median(r[key] for r in runs) for key in runs[0] if all(r.get(key) is not None for r in runs)}
+    report["runs"] = len(runs)
+    if args.imports:
+        report["slowest_imports"] = _slowest_imports(args.imports)
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print(f"import cli:     {report['import'] * 1000:8.1f} ms")
+        print(f"time to prompt: {report['prompt'] * 1000:8.1f} ms   (median of {len(runs)})")
+        if "warmup" in report:
+            print(f"warm-up:        {report['warmup'] * 1000:8.1f} ms   (background, after the prompt)")
+        for seconds, name in report.get("slowest_imports", []):
+            print(f"  {seconds * 1000:8.1f} ms  {name}")
+    if args.budget is not None and report["prompt"] > args.budget:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+# Syntax-aware chunking sized to a token budget
+import ast
+import os
+import re
+from config import CHUNK_TOKENS, CHUNK_OVERLAP_LINES
+from typing import List, Tuple
+
+# bump whenever chunk boundaries change so persisted indexes are rebuilt
+CHUNKER_VERSION = 3
+
+BRACE_EXTS = {".c", ".h", ".cc", ".cpp", ".cxx", ".hpp", ".hh", ".java", ".js", ".jsx", ".ts", ".tsx", ".rs", ".go", ".cs", ".kt", ".swift", ".scala"}
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_CHAR_LIT_RE = re.compile(r"'(\\.|[^\\'])'")
+
+# (text, start_line, end_line), lines are 1-based and inclusive
+Chunk = Tuple[str, int, int]
+Span = Tuple[int, int]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap subword-token estimate: punctuation counts 1, identifiers ~1 per 4 chars."""
+    return sum(max(1, len(w) // 4) if w[0].isalnum() or w[0] == "_" else 1 for w in _WORD_RE.findall(text))
+
+
+def _python_units(lines: List[str], nodes, start: int, end: int) -> List[Span]:
+    """Spans for a sequence of ast statements; leading comments/blank lines join the next node."""
+    units = []
+    cur = start
+    for node in nodes:
+        last = (getattr(node, "end_lineno", None) or node.lineno) - 1
+        if last < cur:
+            continue
+        units.append((cur, last))
+        cur = last + 1
+    if cur <= end:
+        if units:
+            units[-1] = (units[-1][0], end)
+        else:
+            units.append((cur, end))
+    return units
+
+
+def _python_classes(nodes) -> List[ast.ClassDef]:
+    """Classes among nodes, so oversized ones split per member."""
+    return [node for node in nodes if isinstance(node, ast.ClassDef) and node.body]
+
+
+def _class_in(span: Span, classes: List[ast.ClassDef]):
+    """The class a unit span holds, by the line it ends on; a unit may run past it to EOF."""
+    return next((node for node in classes if span[0] <= node.end_lineno - 1 <= span[1]), None)
+
+
+def brace_depths(lines: List[str]) -> List[int]:
+    """Brace depth after each line, skipping string literals and comments (best effort)."""
+    depths = []
+    depth = 0
+    in_block = False
+    for line in lines:
+        i, n = 0, len(line)
+        while i < n:
+            ch = line[i]
+            if in_block:
+                j = line.find("*/", i)
+                if j == -1:
+                    break
+                in_block = False
+                i = j + 2
+                continue
+            if line.startswith("//", i):
+                break
+            if line.startswith("/*", i):
+                in_block = True
+                i += 2
+                continue
+            if ch in "\"`":
+                j = i + 1
+                while j < n and line[j] != ch:
+                    j += 2 if line[j] == "\\" else 1
+                i = j + 1
+                continue
+            if ch == "'":
+                # char literals only; a bare ' may be a Rust lifetime
+                m = _CHAR_LIT_RE.match(line, i)
+                i = m.end() if m else i + 1
+                continue
+            if ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth = max(0, depth - 1)
+            i += 1
+        depths.append(depth)
+    return depths
+
+
+def _brace_units(lines: List[str], depths: List[int], start: int, end: int, base: int) -> List[Span]:
+    """Split lines[start:end+1] where the brace depth returns to `base`."""
+    units = []
+    cur = start
+    opened = has_text = False
+    for i in range(start, end + 1):
+        stripped = lines[i].strip()
+        has_text = has_text or bool(stripped)
+        if depths[i] > base:
+            opened = True
+            continue
+        # close a unit after a block returns to base, a statement end or a blank line
+        if has_text and (opened or not stripped or stripped.endswith((";", "}"))):
+            units.append((cur, i))
+            cur = i + 1
+            opened = has_text = False
+    if cur <= end:
+        if units:
+            units[-1] = (units[-1][0], end)
+        else:
+            units.append((cur, end))
+    return units
+
+
+def _indent_units(lines: List[str], start: int, end: int) -> List[Span]:
+    """Split where a non-blank line starts at column 0 (fallback for unparsable/unknown files)."""
+    units = []
+    cur = start
+    for i in range(start + 1, end + 1):
+        line = lines[i]
+        if line.strip() and not line[0].isspace() and not line.lstrip().startswith((")", "]", "}")):
+            units.append((cur, i - 1))
+            cur = i
+    units.append((cur, end))
+    return units
+
+
+class _Chunker:
+    def __init__(self, lines: List[str], max_tokens: int, overlap: int):
+        self.lines = lines
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.tokens = [estimate_tokens(line) + 1 for line in lines]
+        self.spans: List[Span] = []
+
+    def cost(self, s: int, e: int) -> int:
+        return sum(self.tokens[s:e + 1])
+
+    def windows(self, s: int, e: int):
+        """Split an oversized span into budget-sized line windows."""
+        i = s
+        while i <= e:
+            j, total = i, 0
+            while j <= e and (j == i or total + self.tokens[j] <= self.max_tokens):
+                total += self.tokens[j]
+                j += 1
+            self.spans.append((i, j - 1))
+            i = j
+
+    def pack(self, units: List[Span], split):
+        """Greedily merge consecutive units up to the budget; `split(span)` handles oversized ones."""
+        cur = None
+        cur_cost = 0
+        for s, e in units:
+            c = self.cost(s, e)
+            if cur is not None and cur_cost + c <= self.max_tokens:
+                cur = (cur[0], e)
+                cur_cost += c
+                continue
+            if cur is not None:
+                self.spans.append(cur)
+                cur = None
+            if c > self.max_tokens:
+                split((s, e))
+            else:
+                cur, cur_cost = (s, e), c
+        if cur is not None:
+            self.spans.append(cur)
+
+    def chunks(self) -> List[Chunk]:
+        out = []
+        for s, e in self.spans:
+            # a few lines of leading context shared with the previous chunk
+            s = max(0, s - self.overlap)
+            text = "\n".join(self.lines[s:e + 1])
+            if text.strip():
+                out.append((text, s + 1, e + 1))
+        return out
+
+
+def _chunk_python(c: _Chunker, text: str) -> bool:
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return False
+    last = len(c.lines) - 1
+
+    def split(span, classes):
+        node = _class_in(span, classes)
+        if node is None:
+            c.windows(*span)
+            return
+        body_start = min([node.body[0].lineno] + [d.lineno for d in getattr(node.body[0], "decorator_list", [])]) - 1
+        units = [(span[0], body_start - 1)] if body_start > span[0] else []
+        units += _python_units(c.lines, node.body, max(span[0], body_start), span[1])
+        inner = _python_classes(node.body)
+        c.pack(units, lambda sp: split(sp, inner))
+
+    top = _python_classes(tree.body)
+    c.pack(_python_units(c.lines, tree.body, 0, last), lambda sp: split(sp, top))
+    return True
+
+
+def _chunk_braces(c: _Chunker):
+    depths = brace_depths(c.lines)
+
+    def split(span, base):
+        s, e = span
+        units = _brace_units(c.lines, depths, s, e, base + 1)
+        if len(units) <= 1:
+            c.windows(s, e)
+        else:
+            c.pack(units, lambda sp: split(sp, base + 1))
+
+    c.pack(_brace_units(c.lines, depths, 0, len(c.lines) - 1, 0), lambda sp: split(sp, 0))
+
+
+def chunk_file(path: str, text: str, max_tokens: int = None, overlap: int = None) -> List[Chunk]:
+    """Split a source file into chunks of at most ~max_tokens along syntactic boundaries.
+
+    Python is split with `ast` (top-level statements, then class members), brace
+    languages by brace depth, anything else by unindented lines. Pieces that are
+    still over budget fall back to overlapping line windows. Returns a list of
+    (text, start_line, end_line).
+    """
+    lines = text.splitlines()
+    if not lines:
+        return []
+    c = _Chunker(lines, max_tokens or CHUNK_TOKENS, CHUNK_OVERLAP_LINES if overlap is None else overlap)
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".py", ".pyi") and _chunk_python(c, text):
+        pass
+    elif ext in BRACE_EXTS:
+        _chunk_braces(c)
+    else:
+        c.pack(_indent_units(lines, 0, len(lines) - 1), lambda sp: c.windows(*sp))
+    return c.chunks()
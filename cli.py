@@ -1,11 +1,97 @@
 import asyncio
+import signal
+import threading
 from prompt_toolkit import PromptSession
 from prompt_toolkit.key_binding import KeyBindings
 from prompt_toolkit.application import run_in_terminal
-from indexer import index_codebase
-from config import get_collection, DEFAULTS
-from model import ask_model
-from utils import read_file, green, yellow, cyan, magenta, blue
+from prompt_toolkit.patch_stdout import patch_stdout
+from indexer import index_workspace
+from config import DEFAULTS, PREFETCH, WATCH_FILES, get_roots, select_roots
+from warmup import Warmup
+from prefetch import Prefetcher
+from watcher import Watcher
+from model import Cancel, Session, ask_model, get_client
+from context import build_context
+from utils import green, yellow, cyan, magenta, grey
+
+def _take_flag(parts, flag):
+    """Remove '--flag value' from parts and return value (None if absent)."""
+    if flag in parts:
+        i = parts.index(flag)
+        if i + 1 < len(parts):
+            value = parts[i + 1]
+            del parts[i:i+2]
+            return value
+    return None
+
+
+def _parse_find_args(raw: str):
+    """Split ':find' arguments into (query, options) with options ext, mode, path and root."""
+    parts = raw.split()
+    # support optional --ext flag: --ext .py or --ext py
+    ext = _take_flag(parts, "--ext")
+    mode = _take_flag(parts, "--mode")
+    # directory or glob under each root: --path net/http, --path 'net/**/*.rs'
+    path = _take_flag(parts, "--path")
+    # workspace roots by name: --root api or --root api,web
+    root = _take_flag(parts, "--root")
+
+    # support implicit extension token anywhere: rs, py, cpp, c, js, ts, java
+    known = {"rs", ".rs", "py", ".py", "cpp", ".cpp", "cc", ".cc", "c", ".c", "js", ".js", "ts", ".ts", "java", ".java"}
+    remaining = []
+    for tok in parts:
+        if tok.lower() in known and ext is None:
+            ext = tok
+            continue
+        remaining.append(tok)
+
+    return " ".join(remaining), {"ext": ext, "mode": mode, "path": path, "root": root}
+
+
+def _print_matches(matches):
+    if not matches:
+        print(yellow("No results found."))
+    for res in matches:
+        # support both (src, chunk) and (src, chunk, dist)
+        try:
+            src, chunk, dist = res
+        except ValueError:
+            try:
+                src, chunk = res[0], res[1]
+                dist = None
+            except Exception:
+                src, chunk, dist = None, str(res), None
+
+        print(green(f"\nFile: {src}"))
+        print(chunk)
+        if dist is not None:
+            print(magenta(f"Distance: {dist}"))
+        print("" + "-"*40)
+
+
+async def _await_warmup(warmup: Warmup):
+    """Hold a retrieval command until the background warm-up has finished."""
+    if not warmup.ready():
+        print(cyan("Waiting for the index and embedding model to load..."))
+        await asyncio.to_thread(warmup.wait)
+    if warmup.error is not None:
+        print(yellow(f"Warm-up failed: {warmup.error}"))
+        # report once; the command itself surfaces anything still broken
+        warmup.error = None
+
+
+def _prefetch_target(text: str):
+    """(query, options) the prompt text would search for, or None when it is not a search."""
+    text = text.strip()
+    if text.startswith(":find "):
+        query, opts = _parse_find_args(text[len(":find "):])
+        return (query, opts) if opts["mode"] in (None, "hybrid", "lexical", "vector") else None
+    if text.startswith(":"):
+        return None
+    if text.startswith("--no-cache "):
+        text = text[len("--no-cache "):].strip()
+    return text, {}
+
 
 async def main():
     # get the collection to avoid heavy imports at module import time.
@@ -17,14 +103,28 @@ async def main():
         search_code = getattr(search_mod, "search_code")
     except Exception:
         # Fallback: no-op search (returns empty list)
-        def search_code(q):
+        def search_code(q, **kwargs):
             return []
 
-    collection = get_collection()
-    if collection.count() == 0:
-        index_codebase()
+    # the persisted index is opened (and only rebuilt when missing or stale) and the
+    # embedding model loaded in the background, so the prompt is usable right away
+    warmup = Warmup()
+    warmup.start()
+    # load the LLM while the user types the first question; keep_alive keeps it resident
+    threading.Thread(target=get_client().preload, name="ollama-preload", daemon=True).start()
+    # questions form one conversation until :new; follow-ups reuse the model's state
+    chat = Session()
+
+    # one watcher per workspace root
+    watchers = {}
+    if WATCH_FILES:
+        for name, root in get_roots().items():
+            watchers[name] = Watcher(root)
+            watchers[name].start()
 
     session = PromptSession()
+    # searches run on worker threads; while typing, the prompt text is searched ahead of Enter
+    prefetcher = Prefetcher(search_code, _prefetch_target, ready=warmup.ready)
     bindings = KeyBindings()
 
     @bindings.add("c-c")
@@ -37,21 +137,80 @@ async def main():
         event.app.exit(exception=EOFError())
 
     print("\n🐬 Diver CLI")
-    print("Commands: :index | :find query | :edit file | :run file | :quit")
+    print("Commands: :index [status] | :find query | :grep regex | :sym name | :edit file | :run file | :new | :quit")
 
     while True:
-        q = await session.prompt_async("> ", key_bindings=bindings)
+        # output from background threads (warm-up, watchers) is printed above the prompt
+        buffer = session.default_buffer
+        if PREFETCH:
+            buffer.on_text_changed += prefetcher.on_text_changed
+        try:
+            with patch_stdout(raw=True):
+                q = await session.prompt_async("> ", key_bindings=bindings)
+        finally:
+            if PREFETCH:
+                buffer.on_text_changed -= prefetcher.on_text_changed
+            prefetcher.cancel()
 
         if q.startswith(":"):
             cmd_parts = q[1:].split(maxsplit=1)
             cmd = cmd_parts[0]
 
-            if cmd in ["quit", "exit"]:
+            if cmd == "new":
+                chat.reset()
+                print(cyan("Started a new conversation."))
+
+            elif cmd in ["quit", "exit"]:
                 print("Exiting...")
+                for watcher in watchers.values():
+                    watcher.stop()
                 break
 
             elif cmd == "index":
-                index_codebase()
+                args = cmd_parts[1].split() if len(cmd_parts) > 1 else []
+                names = _take_flag(args, "--root")
+                try:
+                    roots = select_roots(names)
+                except ValueError as e:
+                    print(yellow(str(e)))
+                    continue
+                if args[:1] == ["status"]:
+                    if not watchers:
+                        print(yellow("File watcher is disabled (WATCH_FILES = False)."))
+                        continue
+                    for name, watcher in watchers.items():
+                        if watcher.root not in roots:
+                            continue
+                        st = watcher.status()
+                        print(cyan(f"Watcher [{name}]: {st['mode']}"))
+                        print(f"Pending ({len(st['pending'])}): " + (", ".join(st["pending"]) or "-"))
+                        print(f"In flight ({len(st['in_flight'])}): " + (", ".join(st["in_flight"]) or "-"))
+                        if st["last_result"] is not None:
+                            chunks, changed, removed = st["last_result"]
+                            print(green(f"Last update: {chunks} chunks from {changed} changed files, {removed} removed"))
+                        if st["last_error"]:
+                            print(yellow(f"Last error: {st['last_error']}"))
+                    continue
+                await _await_warmup(warmup)
+                if args[:1] == ["eval"]:
+                    from store import get_store
+
+                    for root in roots:
+                        try:
+                            r = await asyncio.to_thread(get_store(root).evaluate)
+                        except NotImplementedError as e:
+                            print(yellow(str(e)))
+                            break
+                        if not r:
+                            print(yellow(f"Index of {root} is empty."))
+                            continue
+                        mb = 1024 * 1024
+                        print(cyan(f"{root}: {r['kind']} index, {r['vectors']} vectors, compact={r['compact']}"))
+                        print(f"recall@10: {r['recall']:.3f} (without re-rank {r['recall_no_rerank']:.3f})")
+                        print(f"index size: {r['index_bytes'] / mb:.1f} MiB vs {r['baseline_bytes'] / mb:.1f} MiB uncompressed "
+                              f"({r['baseline_bytes'] / max(r['index_bytes'], 1):.1f}x smaller)")
+                    continue
+                index_workspace(full="--full" in args, roots=roots)
 
             elif cmd == "cd":
                 import os
@@ -270,48 +429,92 @@ async def main():
                 run_in_terminal(_open_in_editor)
 
             elif cmd == "find" and len(cmd_parts) > 1:
-                raw = cmd_parts[1]
-                # support optional --ext flag: --ext .py or --ext py
-                parts = raw.split()
-                ext = None
-                # support explicit flag --ext
-                if "--ext" in parts:
-                    i = parts.index("--ext")
-                    if i + 1 < len(parts):
-                        ext = parts[i + 1]
-                        # remove ext flag and value from parts
-                        del parts[i:i+2]
-
-                # support implicit extension token anywhere: rs, py, cpp, c, js, ts, java
-                known = {"rs", ".rs", "py", ".py", "cpp", ".cpp", "cc", ".cc", "c", ".c", "js", ".js", "ts", ".ts", "java", ".java"}
-                remaining = []
-                for tok in parts:
-                    if tok.lower() in known and ext is None:
-                        ext = tok
-                        continue
-                    remaining.append(tok)
-
-                query = " ".join(remaining)
+                query, opts = _parse_find_args(cmd_parts[1])
+                if opts["mode"] not in (None, "hybrid", "lexical", "vector"):
+                    print(yellow("--mode must be one of: hybrid, lexical, vector"))
+                    continue
+                await _await_warmup(warmup)
                 print(cyan("\n🔎 Searching..."))
-                matches = search_code(query, ext=ext)
-                if not matches:
-                    print(yellow("No results found."))
-                for res in matches:
-                    # support both (src, chunk) and (src, chunk, dist)
-                    try:
-                        src, chunk, dist = res
-                    except ValueError:
-                        try:
-                            src, chunk = res[0], res[1]
-                            dist = None
-                        except Exception:
-                            src, chunk, dist = None, str(res), None
-
-                    print(green(f"\nFile: {src}"))
-                    print(chunk)
-                    if dist is not None:
-                        print(magenta(f"Distance: {dist}"))
-                    print("" + "-"*40)
+                try:
+                    _print_matches(await prefetcher.result(query, **opts))
+                except ValueError as e:
+                    print(yellow(str(e)))
+
+            elif cmd == "cache":
+                import query_cache
+                import embed_cache
+                from answer_cache import get_answer_cache
+                from encoder import model_key
+
+                answers = get_answer_cache()
+                if len(cmd_parts) > 1 and cmd_parts[1].strip() == "clear":
+                    if answers is not None:
+                        answers.clear()
+                    print(cyan("Cleared the answer cache."))
+                    continue
+                for label, c in (("query embeddings", query_cache.query_embeddings), ("search results", query_cache.results)):
+                    st = c.stats()
+                    print(f"{label}: {st['hits']} hits / {st['misses']} misses ({st['size']}/{st['maxsize']} entries)")
+                disk = embed_cache.get_embedding_cache(model_key())
+                if disk is not None:
+                    print(f"embedding cache (disk): {disk.hits} hits / {disk.misses} misses ({len(disk.slots)}/{disk.capacity} entries)")
+                if answers is not None:
+                    st = answers.stats()
+                    print(f"answer cache (disk): {st['hits']} hits / {st['misses']} misses ({st['entries']} answers, {st['bytes'] // 1024}/{st['max_bytes'] // 1024} KB)")
+                st = chat.stats()
+                print(f"conversation: {st['turns']} turns, {st['tokens']}/{st['max_tokens']} tokens of model state kept ({st['evictions']} evictions)")
+                print(f"prefetch: {prefetcher.hits} searches reused on Enter / {prefetcher.misses} run on Enter")
+                print(f"index generation: {query_cache.generation()}")
+
+            elif cmd == "grep" and len(cmd_parts) > 1:
+                # regex search over indexed files, narrowed by the trigram index
+                import re
+                import time
+                from filters import SearchFilter
+                from trigram import get_trigram_index
+                from utils import format_location
+
+                parts = cmd_parts[1].split()
+                ext = _take_flag(parts, "--ext")
+                path = _take_flag(parts, "--path")
+                try:
+                    roots = select_roots(_take_flag(parts, "--root"))
+                except ValueError as e:
+                    print(yellow(str(e)))
+                    continue
+                flags = 0
+                if "-i" in parts:
+                    parts.remove("-i")
+                    flags = re.IGNORECASE
+                pattern = " ".join(parts)
+                try:
+                    re.compile(pattern, flags)
+                except re.error as e:
+                    print(yellow(f"Invalid regex: {e}"))
+                    continue
+                await _await_warmup(warmup)
+                start = time.perf_counter()
+                hits = []
+                for root in roots:
+                    flt = SearchFilter(ext=ext, path=path, root=root)
+                    hits += await asyncio.to_thread(
+                        get_trigram_index(root).grep, pattern, flags, flt.accept if flt else None, 200 - len(hits)
+                    )
+                    if len(hits) >= 200:
+                        break
+                for p, line, text in hits:
+                    print(f"{green(format_location(p, line))}  {text.strip()}")
+                print(cyan(f"{len(hits)} matches in {(time.perf_counter() - start) * 1000:.0f} ms"))
+
+            elif cmd == "sym" and len(cmd_parts) > 1:
+                # symbol table lookup: exact, then prefix, then fuzzy ('Name*' = prefix only)
+                name, opts = _parse_find_args(cmd_parts[1])
+                from search import find_symbol
+                await _await_warmup(warmup)
+                try:
+                    _print_matches(await asyncio.to_thread(find_symbol, name, ext=opts["ext"], root=opts["root"]))
+                except ValueError as e:
+                    print(yellow(str(e)))
 
             else:
                 # unk command: try running it as a shell command.
@@ -336,18 +539,28 @@ async def main():
                 run_in_terminal(_run_shell)
 
         else:
-            matches = search_code(q)
-            # build context using available snippets
-            snippets = []
-            for res in matches:
-                try:
-                    src, snippet, _ = res
-                except ValueError:
-                    try:
-                        src, snippet = res[0], res[1]
-                    except Exception:
-                        src, snippet = None, str(res)
-                snippets.append(f"File: {src}\n{snippet}")
-
-            context = "\n\n".join(snippets)
-            answer = await asyncio.to_thread(ask_model, q, context)
+            # "--no-cache question" always runs the model (the fresh answer replaces the cached one)
+            q = q.strip()
+            use_cache = q != "--no-cache" and not q.startswith("--no-cache ")
+            if not use_cache:
+                q = q[len("--no-cache"):].strip()
+            if not q:
+                # an empty line neither waits for the warm-up nor reaches the model
+                continue
+            await _await_warmup(warmup)
+            matches = await prefetcher.result(q)
+            # merged, de-duplicated spans of the hits packed into the token budget; code the
+            # conversation already holds is not sent again
+            context, report = build_context(matches, seen=chat.seen)
+            print(grey(
+                f"context: {report['tokens']}/{report['budget']} tokens, {report['blocks']} blocks from {report['files']} files"
+                f" ({report['merged']} merged, {report['duplicates']} duplicates, {report['in_session']} already in the conversation,"
+                f" {report['dropped_tokens']} tokens dropped)"
+            ))
+            # Ctrl-C stops this answer only, not the CLI
+            cancel = Cancel()
+            previous = signal.signal(signal.SIGINT, lambda signum, frame: cancel.set())
+            try:
+                answer = await asyncio.to_thread(ask_model, q, context, cancel=cancel, session=chat, seen=report["lines"], use_cache=use_cache)
+            finally:
+                signal.signal(signal.SIGINT, previous)
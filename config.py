@@ -1,11 +1,116 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
-from typing import Optional
+import hashlib
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+	from sentence_transformers import SentenceTransformer
 
 CODE_DIR = "./src"
+# workspace: code roots searched together, each indexed into its own stores under INDEX_DIR.
+# A list of paths (named after their last directory) or a {name: path} dict; `:find --root`
+# limits a search to some of them
+CODE_ROOTS = [CODE_DIR]
+# threads a search fans out on (one task per root, so latency follows the slowest root)
+SEARCH_THREADS = 8
 MODEL_NAME = "BAAI/bge-m3"
 OLLAMA_MODEL = "qwen3:8b"
+# Ollama's REST API: answers stream over a pool of OLLAMA_POOL_SIZE keep-alive connections;
+# OLLAMA_KEEP_ALIVE keeps the model loaded between questions ("30m", seconds, or -1 for ever),
+# and a stream with no new token for OLLAMA_TIMEOUT seconds fails
+OLLAMA_URL = "http://127.0.0.1:11434"
+OLLAMA_KEEP_ALIVE = "30m"
+OLLAMA_POOL_SIZE = 2
+OLLAMA_TIMEOUT = 180
+# question context: retrieved spans are packed into CONTEXT_TOKENS (estimated) tokens, best-ranked
+# first. Spans of a file that overlap or are CONTEXT_MERGE_GAP lines apart are merged, and a span
+# whose lines are CONTEXT_DUP_THRESHOLD contained in one already packed is dropped
+CONTEXT_TOKENS = 2048
+CONTEXT_MERGE_GAP = 3
+CONTEXT_DUP_THRESHOLD = 0.8
+# conversations: each answer's token state is sent with the next question, so follow-ups only
+# prefill the new turn. Past SESSION_MAX_TOKENS (keep it under the model's num_ctx) the state is
+# dropped and the next turn restarts with a recap of the last SESSION_KEEP_TURNS turns
+SESSION_MAX_TOKENS = 3072
+SESSION_KEEP_TURNS = 2
+# answers are cached on disk for ANSWER_CACHE_TTL_HOURS, keyed by model, question, the code sent
+# with it and the conversation state (an edited chunk means a new key); LRU-evicted past
+# ANSWER_CACHE_MB, 0 disables it. Prefix a question with --no-cache to bypass it
+ANSWER_CACHE_MB = 64
+ANSWER_CACHE_TTL_HOURS = 168
 TOP_K = 7 
+# in-memory LRU sizes for query embeddings and search results (results are dropped on re-index)
+QUERY_CACHE_SIZE = 256
+RESULT_CACHE_SIZE = 128
+# default retrieval for :find and questions: "hybrid" (BM25 + vectors), "lexical" or "vector"
+SEARCH_MODE = "hybrid"
+# speculative retrieval: once typing pauses for PREFETCH_DEBOUNCE_MS, questions and :find queries
+# of at least PREFETCH_MIN_CHARS are searched in the background; on Enter the result is reused when
+# the words are the same or the text is PREFETCH_MIN_SIMILARITY similar (difflib ratio)
+PREFETCH = True
+PREFETCH_DEBOUNCE_MS = 250
+PREFETCH_MIN_CHARS = 12
+PREFETCH_MIN_SIMILARITY = 0.95
+
+# file discovery: directories never descended into, ignore files honored in the tree
+# (gitignore syntax), and files larger than MAX_FILE_BYTES are skipped
+IGNORE_DIRS = {".git", ".hg", ".svn", "node_modules", "build", ".ts_build", "__pycache__", ".venv", "venv", ".tox", ".mypy_cache", ".pytest_cache", "target", "dist"}
+IGNORE_FILES = (".gitignore", ".diverignore")
+MAX_FILE_BYTES = 1024 * 1024
+
+# chunking: token budget per chunk (keep at or below the model's max_seq_length) and
+# lines of leading context repeated from the previous chunk
+CHUNK_TOKENS = 512
+CHUNK_OVERLAP_LINES = 2
+
+# embedding: chunks are length-sorted within windows of EMBED_SORT_WINDOW batches to cut
+# padding; EMBED_PROCESSES > 1 shards batches across that many CPU worker processes
+EMBED_SORT_WINDOW = 8
+EMBED_PROCESSES = 0
+# size cap of the shared on-disk embedding cache (LRU evicted); 0 disables it
+EMBED_CACHE_MB = 1024
+# embedding runtime: "torch" (fp32), "int8" (torch dynamic quantization of the Linear layers,
+# CPU) or "onnx" (ONNX Runtime; the model is exported once and cached under INDEX_DIR/onnx).
+# EMBED_THREADS > 0 pins the intra-op threads; inputs are cut at EMBED_MAX_SEQ_LENGTH tokens
+# (the chunk budget; 0 keeps the model's own limit). Check a runtime with `diver.py check-embed`
+EMBED_RUNTIME = "torch"
+EMBED_THREADS = 0
+EMBED_MAX_SEQ_LENGTH = CHUNK_TOKENS
+
+# persisted index state (manifest, stores) lives under INDEX_DIR, one folder per code root
+INDEX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "diver")
+# keep the vector DB on disk under the code root's index dir; False uses an in-memory store
+PERSIST_INDEX = True
+
+# shared embedding daemon (`diver.py embed-server`): while one is listening on EMBED_SOCKET,
+# every Diver process embeds through it instead of loading its own model (EMBED_DAEMON = False
+# never uses it). Requests arriving within EMBED_BATCH_WINDOW_MS of each other are encoded
+# together, up to EMBED_SERVER_MAX_BATCH texts
+EMBED_DAEMON = True
+EMBED_SOCKET = os.path.join(INDEX_DIR, "embed.sock")
+EMBED_BATCH_WINDOW_MS = 5
+EMBED_SERVER_MAX_BATCH = 256
+
+# vector store: "chroma" or "faiss" (index type follows corpus size unless FAISS_INDEX
+# pins "flat", "hnsw" or "ivfpq"); HNSW is used from FAISS_HNSW_MIN vectors, IVF-PQ from FAISS_IVFPQ_MIN
+VECTOR_BACKEND = "chroma"
+FAISS_INDEX = "auto"
+FAISS_HNSW_MIN = 50_000
+FAISS_IVFPQ_MIN = 1_000_000
+FAISS_HNSW_M = 32
+FAISS_EF_SEARCH = 64
+FAISS_NPROBE = 16
+# compact FAISS storage: PCA down to COMPACT_DIM dimensions and int8 codes, with the top
+# COMPACT_RERANK * k candidates re-ranked against the float16 originals
+COMPACT_VECTORS = False
+COMPACT_DIM = 512
+COMPACT_RERANK = 4
+
+# keep the index live while the CLI runs: re-index changed files after WATCH_DEBOUNCE
+# seconds of quiet (inotify on Linux, otherwise polling every WATCH_POLL_INTERVAL seconds)
+WATCH_FILES = True
+WATCH_DEBOUNCE = 0.5
+WATCH_POLL_INTERVAL = 2.0
 
 # runtime and compiler configuration 
 DEFAULTS = {
@@ -23,31 +128,111 @@ DEFAULTS = {
 	"editor": "vim",
 }
 
-# lazily-initialized heavy resources to avoid long import-time delays.
-_embedder: Optional[SentenceTransformer] = None
-_chroma_client = None
-_collection = None
+# roots are resolved once, against the directory Diver was started in: `:cd` changes the working
+# directory but must not move searches, stores, manifests or watchers to another (empty) index
+CODE_DIR = os.path.abspath(CODE_DIR)
+if isinstance(CODE_ROOTS, dict):
+	CODE_ROOTS = {name: os.path.abspath(path) for name, path in CODE_ROOTS.items()}
+else:
+	CODE_ROOTS = [os.path.abspath(path) for path in CODE_ROOTS]
+
+def get_index_dir(code_dir: str = CODE_DIR) -> str:
+	"""Return (and create) the index directory for a code root."""
+	root = os.path.abspath(code_dir)
+	key = hashlib.sha1(root.encode("utf-8")).hexdigest()[:12]
+	path = os.path.join(INDEX_DIR, f"{os.path.basename(root) or 'root'}-{key}")
+	os.makedirs(path, exist_ok=True)
+	return path
 
-def get_embedder() -> SentenceTransformer:
-	"""Return a singleton SentenceTransformer instance. Loading is deferred until first use."""
+def get_roots() -> Dict[str, str]:
+	"""Workspace roots by name, in CODE_ROOTS order."""
+	if isinstance(CODE_ROOTS, dict):
+		return dict(CODE_ROOTS)
+	roots = {}
+	for path in CODE_ROOTS:
+		name = os.path.basename(path) or "root"
+		if name in roots:
+			# two roots with the same directory name: qualify with the parent
+			name = f"{os.path.basename(os.path.dirname(path))}/{name}"
+		roots[name] = path
+	return roots
+
+def select_roots(names=None) -> List[str]:
+	"""Paths of the named roots ("a,b", a list, or None for all); names may also be paths.
+
+	Raises ValueError for a name that is not in the workspace.
+	"""
+	roots = get_roots()
+	if not names:
+		return list(roots.values())
+	if isinstance(names, str):
+		names = names.split(",")
+	by_path = {os.path.abspath(p): p for p in roots.values()}
+	out = []
+	for name in (n.strip() for n in names):
+		path = roots.get(name) or by_path.get(os.path.abspath(name))
+		if path is None:
+			raise ValueError(f"Unknown root {name!r} (roots: {', '.join(roots)})")
+		if path not in out:
+			out.append(path)
+	return out
+
+# lazily-initialized heavy resources to avoid long import-time delays: chromadb and
+# sentence_transformers (torch) are only imported by the getters below
+_embedder: Optional["SentenceTransformer"] = None
+_chroma_clients = {}
+_collections = {}
+# the CLI warms these up on a background thread while a command may ask for them too
+_embedder_lock = threading.Lock()
+_chroma_lock = threading.RLock()
+
+def get_embedder() -> "SentenceTransformer":
+	"""Return a singleton SentenceTransformer instance in EMBED_RUNTIME. Loading is deferred until first use."""
 	global _embedder
-	if _embedder is None:
-		print("Loading embedding model...")
-		_embedder = SentenceTransformer(MODEL_NAME)
+	with _embedder_lock:
+		if _embedder is None:
+			from embed_runtime import load_embedder
+
+			print("Loading embedding model...")
+			_embedder = load_embedder()
 	return _embedder
 
-def get_chroma_client():
-	"""Return a singleton Chroma client."""
-	global _chroma_client
-	if _chroma_client is None:
-		_chroma_client = chromadb.Client()
-	return _chroma_client
-
-def get_collection(name: str = "codebase"):
-	"""Return or create the named collection in Chroma. Deferred until first use."""
-	global _collection
-	if _collection is None:
-		client = get_chroma_client()
-		_collection = client.get_or_create_collection(name)
-	return _collection
+def get_chroma_client(code_dir: str = CODE_DIR):
+	"""Return the Chroma client for a code root, persisted under the root's index dir."""
+	# in-memory clients share one process-wide system, so roots share it with separate collection names
+	key = os.path.abspath(code_dir) if PERSIST_INDEX else None
+	with _chroma_lock:
+		if key not in _chroma_clients:
+			import chromadb
+
+			if PERSIST_INDEX:
+				_chroma_clients[key] = chromadb.PersistentClient(path=os.path.join(get_index_dir(code_dir), "chroma"))
+			else:
+				_chroma_clients[key] = chromadb.Client()
+		return _chroma_clients[key]
+
+def _collection_name(name: str, code_dir: str) -> str:
+	if PERSIST_INDEX:
+		return name
+	return f"{name}-{hashlib.sha1(os.path.abspath(code_dir).encode('utf-8')).hexdigest()[:12]}"
+
+def get_collection(name: str = "codebase", code_dir: str = CODE_DIR):
+	"""Return or create the named collection of a code root in Chroma. Deferred until first use."""
+	key = (os.path.abspath(code_dir), name)
+	with _chroma_lock:
+		if key not in _collections:
+			client = get_chroma_client(code_dir)
+			_collections[key] = client.get_or_create_collection(_collection_name(name, code_dir))
+		return _collections[key]
 
+def reset_collection(name: str = "codebase", code_dir: str = CODE_DIR):
+	"""Drop and recreate the named collection (e.g. when the embedding model changed)."""
+	with _chroma_lock:
+		client = get_chroma_client(code_dir)
+		try:
+			client.delete_collection(_collection_name(name, code_dir))
+		except Exception:
+			pass
+		collection = client.get_or_create_collection(_collection_name(name, code_dir))
+		_collections[(os.path.abspath(code_dir), name)] = collection
+		return collection
@@ -0,0 +1,130 @@
+# Token-budgeted LLM context: merge overlapping spans, drop near-duplicates, pack by rank
+import os
+from chunker import estimate_tokens
+from config import CONTEXT_DUP_THRESHOLD, CONTEXT_MERGE_GAP, CONTEXT_TOKENS
+from typing import List, Optional, Tuple
+from utils import format_location, parse_location, read_file
+
+# a block cut to fit the budget keeps at least this many tokens, otherwise it is skipped
+_MIN_PIECE_TOKENS = 48
+
+
+class _Block:
+    """A span of one file (or a bare snippet) with the best rank among the hits it covers."""
+
+    def __init__(self, rank: int, path: str, start: Optional[int], end: Optional[int], text: str = None):
+        self.rank = rank
+        self.path = path
+        self.start = start
+        self.end = end
+        self.text = text
+
+    def header(self) -> str:
+        return f"File: {format_location(self.path, self.start, self.end)}\n"
+
+
+def _merge_spans(hits) -> Tuple[List[_Block], int]:
+    """Blocks for hits in rank order, joining spans of a file that overlap or are CONTEXT_MERGE_GAP lines apart."""
+    by_file = {}
+    blocks = []
+    for rank, (location, snippet, *_) in enumerate(hits):
+        path, start, end = parse_location(location)
+        if start is None or not os.path.isfile(path):
+            # no line span to merge on; use the snippet as it is
+            blocks.append(_Block(rank, location, None, None, snippet))
+            continue
+        by_file.setdefault(os.path.abspath(path), []).append(_Block(rank, path, start, end))
+    merged = 0
+    for spans in by_file.values():
+        spans.sort(key=lambda b: b.start)
+        joined = [spans[0]]
+        for b in spans[1:]:
+            cur = joined[-1]
+            if b.start <= cur.end + CONTEXT_MERGE_GAP + 1:
+                cur.end = max(cur.end, b.end)
+                cur.rank = min(cur.rank, b.rank)
+                merged += 1
+            else:
+                joined.append(b)
+        # one read per file, for all of its blocks
+        lines = read_file(joined[0].path).splitlines()
+        for b in joined:
+            b.text = "\n".join(lines[b.start - 1:b.end])
+        blocks.extend(joined)
+    blocks = [b for b in blocks if b.text and b.text.strip()]
+    blocks.sort(key=lambda b: b.rank)
+    return blocks, merged
+
+
+def _line_set(text: str) -> set:
+    return {line.strip() for line in text.splitlines() if line.strip()}
+
+
+def _contained(lines: set, line_sets: List[set]) -> bool:
+    return any(len(lines & other) >= CONTEXT_DUP_THRESHOLD * len(lines) for other in line_sets)
+
+
+def build_context(hits, budget: int = CONTEXT_TOKENS, seen: List[set] = None) -> Tuple[str, dict]:
+    """Pack search results (location, snippet, distance) into at most budget tokens.
+
+    Spans of the same file that overlap or nearly touch are merged, blocks whose
+    lines are mostly (CONTEXT_DUP_THRESHOLD) contained in an earlier block are
+    dropped, and blocks are added best-ranked first; one that does not fit is
+    cut to its leading lines. Blocks contained in seen (line sets of code the
+    model already has, e.g. model.Session.seen) are left out as well.
+
+    Returns the context and a report of the tokens used and dropped; its
+    "lines" are the line sets of the packed blocks.
+    """
+    blocks, merged = _merge_spans(hits)
+    kept_lines = []
+    files = set()
+    parts = []
+    used = 0
+    report = {"hits": len(hits), "merged": merged, "duplicates": 0, "in_session": 0, "truncated": 0, "skipped": 0, "dropped_tokens": 0}
+    for b in blocks:
+        lines = _line_set(b.text)
+        cost = estimate_tokens(b.text) + b.text.count("\n") + 1
+        if seen and _contained(lines, seen):
+            report["in_session"] += 1
+            continue
+        if _contained(lines, kept_lines):
+            report["duplicates"] += 1
+            report["dropped_tokens"] += cost
+            continue
+        header = b.header()
+        room = budget - used - estimate_tokens(header) - 1
+        text = b.text
+        if cost > room:
+            if room < _MIN_PIECE_TOKENS:
+                report["skipped"] += 1
+                report["dropped_tokens"] += cost
+                continue
+            # keep the leading lines that fit
+            keep, total = [], 0
+            for line in text.splitlines():
+                c = estimate_tokens(line) + 1
+                if total + c > room - 1:
+                    break
+                keep.append(line)
+                total += c
+            if not keep:
+                # not even the first line fits
+                report["skipped"] += 1
+                report["dropped_tokens"] += cost
+                continue
+            if b.start is not None:
+                b.end = b.start + len(keep) - 1
+                header = b.header()
+            text = "\n".join(keep + ["..."])
+            # only what was sent counts as seen
+            lines = _line_set(text)
+            report["truncated"] += 1
+            report["dropped_tokens"] += cost - total
+            cost = total + 1
+        kept_lines.append(lines)
+        files.add(b.path)
+        parts.append(header + text)
+        used += estimate_tokens(header) + 1 + cost
+    report.update(tokens=used, budget=budget, blocks=len(parts), files=len(files), lines=kept_lines)
+    return "\n\n".join(parts), report
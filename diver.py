@@ -3,7 +3,6 @@ import subprocess
 import signal
 import sys
 import os
-from cli import main
 
 
 def start_ollama_server():
@@ -43,6 +42,14 @@ def _cleanup_and_exit(server_process, code=0):
 
 
 if __name__ == "__main__":
+  if len(sys.argv) > 1:
+    # headless subcommands (index, search) never start the Ollama server
+    from headless import run
+
+    sys.exit(run(sys.argv[1:]))
+
+  from cli import main
+
   server_process = None
   # start server first so signals during startup are also handled
   try:
@@ -0,0 +1,141 @@
+# Content-addressed on-disk embedding cache (memory-mapped vectors + LRU slot index)
+import atexit
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from config import INDEX_DIR, EMBED_CACHE_MB
+from typing import Dict, List, Optional
+
+_caches: Dict[str, "EmbeddingCache"] = {}
+_caches_lock = threading.Lock()
+
+
+def text_key(text: str) -> bytes:
+    """Raw sha1 of a chunk; the cache is already namespaced by model."""
+    return hashlib.sha1(text.encode("utf-8", "surrogatepass")).digest()
+
+
+class EmbeddingCache:
+    """Fixed-capacity store of embeddings for one model, shared by all code roots.
+
+    Vectors live in a memory-mapped float32 array (`vectors.f32`) of `capacity`
+    slots. `index.json` maps content digests to slots in LRU order; when full the
+    least recently used slot is reused. A parallel `keys.bin` array records which
+    digest owns each slot so a slot overwritten by another process is a miss, never
+    a wrong vector; it holds raw 20-byte rows (a bytes dtype would drop trailing NULs
+    of a digest and never match it again).
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.slots: "OrderedDict[bytes, int]" = OrderedDict()
+        self.dim = 0
+        self.capacity = 0
+        self.vectors = None
+        self.keys = None
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def _open(self, dim: int, create: bool):
+        self.dim = dim
+        self.capacity = max(1, self.max_bytes // (dim * 4))
+        mode = "w+" if create else "r+"
+        self.vectors = np.memmap(os.path.join(self.path, "vectors.f32"), dtype=np.float32, mode=mode, shape=(self.capacity, dim))
+        self.keys = np.memmap(os.path.join(self.path, "keys.bin"), dtype=np.uint8, mode=mode, shape=(self.capacity, 20))
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.path, "index.json"), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            dim = int(data["dim"])
+            if dim <= 0 or max(1, self.max_bytes // (dim * 4)) != int(data["capacity"]):
+                # size cap changed: start over rather than remapping
+                return
+            self._open(dim, create=False)
+            for hexkey, slot in data["slots"]:
+                self.slots[bytes.fromhex(hexkey)] = slot
+        except (OSError, ValueError, KeyError, TypeError):
+            self.slots.clear()
+            self.vectors = self.keys = None
+            self.dim = self.capacity = 0
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        out = []
+        with self.lock:
+            for k in keys:
+                slot = self.slots.get(k)
+                if slot is not None and self.keys[slot].tobytes() == k:
+                    self.slots.move_to_end(k)
+                    out.append(np.array(self.vectors[slot]))
+                    self.hits += 1
+                else:
+                    out.append(None)
+                    self.misses += 1
+        return out
+
+    def put_many(self, keys: List[bytes], vecs: np.ndarray):
+        if not len(keys):
+            return
+        with self.lock:
+            if self.vectors is None:
+                self._open(vecs.shape[1], create=True)
+            if vecs.shape[1] != self.dim:
+                return
+            for k, v in zip(keys, vecs):
+                slot = self.slots.get(k)
+                if slot is None:
+                    if len(self.slots) < self.capacity:
+                        slot = len(self.slots)
+                    else:
+                        # evict the least recently used entry and reuse its slot
+                        _, slot = self.slots.popitem(last=False)
+                self.slots[k] = slot
+                self.slots.move_to_end(k)
+                self.vectors[slot] = v
+                self.keys[slot] = np.frombuffer(k, dtype=np.uint8)
+            self.dirty = True
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty or self.vectors is None:
+                return
+            self.vectors.flush()
+            self.keys.flush()
+            tmp = os.path.join(self.path, "index.json.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({
+                    "dim": self.dim,
+                    "capacity": self.capacity,
+                    "slots": [[k.hex(), s] for k, s in self.slots.items()],
+                }, f)
+            os.replace(tmp, os.path.join(self.path, "index.json"))
+            self.dirty = False
+
+
+def get_embedding_cache(model_key: str) -> Optional[EmbeddingCache]:
+    """Return the cache for a model (None when EMBED_CACHE_MB is 0)."""
+    if EMBED_CACHE_MB <= 0:
+        return None
+    with _caches_lock:
+        cache = _caches.get(model_key)
+        if cache is None:
+            name = hashlib.sha1(model_key.encode("utf-8")).hexdigest()[:12]
+            cache = EmbeddingCache(os.path.join(INDEX_DIR, "embed-cache", name), int(EMBED_CACHE_MB * 1024 * 1024))
+            _caches[model_key] = cache
+        return cache
+
+
+def flush_all():
+    for cache in list(_caches.values()):
+        cache.flush()
+
+
+atexit.register(flush_all)
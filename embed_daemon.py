@@ -0,0 +1,202 @@
+# Shared embedding daemon on a Unix socket: one loaded model serves every Diver process
+import asyncio
+import json
+import os
+import signal
+import socket
+import struct
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from config import EMBED_BATCH_WINDOW_MS, EMBED_DAEMON, EMBED_SERVER_MAX_BATCH, EMBED_SOCKET
+from typing import List, Optional, Tuple
+
+# frame: header length and payload length, then a JSON header and a raw payload
+_FRAME = struct.Struct("!II")
+# after a failed connect, run locally for this long before trying the daemon again
+_RETRY_SECONDS = 5.0
+_CONNECT_TIMEOUT = 1.0
+
+_down_until = 0.0
+
+
+def _pack(header: dict, payload: bytes = b"") -> bytes:
+    data = json.dumps(header).encode("utf-8")
+    return _FRAME.pack(len(data), len(payload)) + data + payload
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        part = sock.recv(min(n - len(buf), 1 << 20))
+        if not part:
+            raise ConnectionError("embedding daemon closed the connection")
+        buf += part
+    return bytes(buf)
+
+
+def _request(header: dict, path: str = EMBED_SOCKET) -> Tuple[dict, bytes]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(_CONNECT_TIMEOUT)
+        sock.connect(path)
+        # encoding a large batch behind other clients can take a while
+        sock.settimeout(None)
+        sock.sendall(_pack(header))
+        hlen, plen = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+        return json.loads(_recv_exact(sock, hlen)), _recv_exact(sock, plen)
+
+
+def encode_remote(texts: List[str], batch_size: int = 32) -> Optional[np.ndarray]:
+    """Embeddings of texts from the daemon, or None when no daemon serves this model.
+
+    Failures (no daemon, a daemon for another model or runtime, a dropped
+    connection) fall back to the caller's local model for _RETRY_SECONDS.
+    """
+    global _down_until
+    if not EMBED_DAEMON or time.monotonic() < _down_until or not os.path.exists(EMBED_SOCKET):
+        return None
+    from encoder import model_key
+
+    try:
+        header, payload = _request({"op": "encode", "key": model_key(), "texts": texts, "batch_size": batch_size})
+    except (OSError, ValueError):
+        _down_until = time.monotonic() + _RETRY_SECONDS
+        return None
+    if "error" in header:
+        _down_until = time.monotonic() + _RETRY_SECONDS
+        return None
+    return np.frombuffer(payload, dtype=np.float32).reshape(header["shape"])
+
+
+def status(path: str = EMBED_SOCKET) -> Optional[dict]:
+    """Counters of the running daemon, or None when none is listening."""
+    try:
+        return _request({"op": "status"}, path)[0]
+    except (OSError, ValueError):
+        return None
+
+
+class _Batcher:
+    """Collects requests for EMBED_BATCH_WINDOW_MS and encodes them as one batch.
+
+    The model runs on a single worker thread; while it is busy, new requests
+    queue up and form the next batch, so concurrent clients share forward passes.
+    """
+
+    def __init__(self, batch_size: int, window: float, max_batch: int):
+        self.batch_size = batch_size
+        self.window = window
+        self.max_batch = max_batch
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self.stats = {"requests": 0, "texts": 0, "batches": 0}
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, fut))
+        return await fut
+
+    async def run(self):
+        from encoder import encode_local
+
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            count = len(items[0][0])
+            deadline = loop.time() + self.window
+            while count < self.max_batch:
+                if self.queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    # whatever queued up while the model was busy joins this batch
+                    item = self.queue.get_nowait()
+                items.append(item)
+                count += len(item[0])
+            texts = [t for ts, _ in items for t in ts]
+            try:
+                vecs = await loop.run_in_executor(self.executor, encode_local, texts, self.batch_size)
+            except Exception as e:
+                for _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.stats["requests"] += len(items)
+            self.stats["texts"] += len(texts)
+            self.stats["batches"] += 1
+            start = 0
+            for ts, fut in items:
+                if not fut.done():
+                    fut.set_result(vecs[start:start + len(ts)])
+                start += len(ts)
+
+
+async def _serve(path: str, batch_size: int):
+    from config import get_embedder
+    from encoder import model_key
+
+    key = model_key()
+    # load before listening, so the first client already gets a warm model
+    await asyncio.to_thread(get_embedder)
+    batcher = _Batcher(batch_size, EMBED_BATCH_WINDOW_MS / 1000, EMBED_SERVER_MAX_BATCH)
+    started = time.time()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                hlen, plen = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+                header = json.loads(await reader.readexactly(hlen))
+                await reader.readexactly(plen)
+                if header.get("op") == "status":
+                    writer.write(_pack(dict(batcher.stats, key=key, pid=os.getpid(), uptime=time.time() - started)))
+                elif header.get("key") != key:
+                    writer.write(_pack({"error": f"daemon serves {key}", "key": key}))
+                else:
+                    vecs = np.ascontiguousarray(await batcher.encode(header["texts"]), dtype=np.float32)
+                    writer.write(_pack({"shape": list(vecs.shape)}, vecs.tobytes()))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            try:
+                writer.write(_pack({"error": str(e)}))
+                await writer.drain()
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_unix_server(handle, path=path)
+    os.chmod(path, 0o600)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    print(f"Embedding daemon for {key} listening on {path}")
+    async with server:
+        task = asyncio.create_task(batcher.run())
+        await stop.wait()
+        task.cancel()
+    batcher.executor.shutdown(wait=False)
+
+
+def serve(path: str = EMBED_SOCKET, batch_size: int = 32):
+    """Run the embedding daemon in the foreground until SIGINT or SIGTERM."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if os.path.exists(path):
+        if status(path) is not None:
+            raise RuntimeError(f"An embedding daemon is already listening on {path}")
+        # left behind by a daemon that did not shut down cleanly
+        os.unlink(path)
+    try:
+        asyncio.run(_serve(path, batch_size))
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,110 @@
+# Embedding model runtimes: fp32 torch, torch dynamic int8 quantization and ONNX Runtime
+import os
+import re
+from config import EMBED_MAX_SEQ_LENGTH, EMBED_RUNTIME, EMBED_THREADS, INDEX_DIR, MODEL_NAME
+
+RUNTIMES = ("torch", "int8", "onnx")
+# bump when the export below changes, so cached exports are redone
+ONNX_EXPORT_VERSION = 1
+_INPUTS = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def onnx_dir() -> str:
+    """Where the ONNX export of MODEL_NAME is cached."""
+    name = re.sub(r"[^\w.-]+", "_", MODEL_NAME)
+    return os.path.join(INDEX_DIR, "onnx", f"{name}-v{ONNX_EXPORT_VERSION}")
+
+
+def _export_onnx(model, path: str):
+    """Export the Hugging Face model inside a SentenceTransformer (token embeddings only)."""
+    import torch
+
+    class _Hidden(torch.nn.Module):
+        def __init__(self, hf):
+            super().__init__()
+            self.hf = hf
+
+        def forward(self, *args):
+            return self.hf(*args, return_dict=False)[0]
+
+    sample = model.tokenizer(["def f(x):\n    return x + 1"], return_tensors="pt")
+    names = [n for n in _INPUTS if n in sample]
+    dynamic = {n: {0: "batch", 1: "seq"} for n in names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "seq"}
+    tmp = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    with torch.no_grad():
+        # models over 2 GB are written with external weight files next to model.onnx
+        torch.onnx.export(
+            _Hidden(model[0].auto_model.eval()), tuple(sample[n] for n in names), os.path.join(tmp, "model.onnx"),
+            input_names=names, output_names=["last_hidden_state"], dynamic_axes=dynamic, opset_version=14,
+        )
+    # rename into place, so an interrupted export is never loaded
+    os.replace(tmp, path)
+
+
+def _onnx_model(hf_config, session):
+    """A stand-in for the Hugging Face model that runs an ONNX Runtime session."""
+    import torch
+
+    names = [i.name for i in session.get_inputs()]
+
+    class OnnxTransformer(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            # sentence-transformers reads config.output_hidden_states
+            self.config = hf_config
+
+        def forward(self, input_ids=None, attention_mask=None, token_type_ids=None, return_dict=False, **kwargs):
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+            out = session.run(None, {n: feeds[n].cpu().numpy() for n in names})[0]
+            return (torch.from_numpy(out),)
+
+    return OnnxTransformer()
+
+
+def _use_onnx(model):
+    """Swap the model's transformer for ONNX Runtime, exporting it on first use."""
+    import onnxruntime
+
+    path = onnx_dir()
+    if not os.path.isdir(path):
+        print("Exporting embedding model to ONNX (first run only)...")
+        _export_onnx(model, path)
+    opts = onnxruntime.SessionOptions()
+    opts.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if EMBED_THREADS:
+        opts.intra_op_num_threads = EMBED_THREADS
+        opts.inter_op_num_threads = 1
+    session = onnxruntime.InferenceSession(os.path.join(path, "model.onnx"), opts, providers=["CPUExecutionProvider"])
+    transformer = model[0]
+    # the torch weights are dropped here; tokenizer, pooling and normalization stay as they are
+    transformer.auto_model = _onnx_model(transformer.auto_model.config, session)
+
+
+def load_embedder(runtime: str = None):
+    """SentenceTransformer for MODEL_NAME in runtime (default EMBED_RUNTIME).
+
+    "int8" quantizes every Linear layer to int8 weights with activations quantized
+    on the fly; "onnx" runs the transformer on ONNX Runtime. EMBED_THREADS and
+    EMBED_MAX_SEQ_LENGTH apply to every runtime.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    runtime = runtime or EMBED_RUNTIME
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown EMBED_RUNTIME {runtime!r} (use {', '.join(RUNTIMES)})")
+    if EMBED_THREADS:
+        import torch
+
+        torch.set_num_threads(EMBED_THREADS)
+    model = SentenceTransformer(MODEL_NAME, device=None if runtime == "torch" else "cpu")
+    if runtime == "int8":
+        import torch
+
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    elif runtime == "onnx":
+        _use_onnx(model)
+    if EMBED_MAX_SEQ_LENGTH:
+        model.max_seq_length = EMBED_MAX_SEQ_LENGTH
+    return model
@@ -0,0 +1,142 @@
+# Batch embedding engine (length-sorted batches, optional multi-process encoding)
+import atexit
+import time
+import numpy as np
+from config import EMBED_MAX_SEQ_LENGTH, EMBED_PROCESSES, EMBED_RUNTIME, MODEL_NAME, get_embedder
+from embed_runtime import load_embedder
+from embed_cache import get_embedding_cache, text_key
+from embed_daemon import encode_remote
+from typing import List
+
+_pool = None
+
+
+def _lengths(embedder, texts: List[str]) -> List[int]:
+    """Token length of each text (capped at the model's max_seq_length), or chars as a fallback."""
+    tokenizer = getattr(embedder, "tokenizer", None)
+    limit = getattr(embedder, "max_seq_length", None) or 1 << 30
+    if tokenizer is not None:
+        try:
+            ids = tokenizer(texts, add_special_tokens=False, truncation=False)["input_ids"]
+            return [min(len(t), limit) for t in ids]
+        except Exception:
+            pass
+    return [len(t) for t in texts]
+
+
+def _get_pool(embedder):
+    """Start (once) a pool of EMBED_PROCESSES CPU workers, each holding its own model copy."""
+    global _pool
+    if _pool is None:
+        _pool = embedder.start_multi_process_pool(target_devices=["cpu"] * EMBED_PROCESSES)
+        atexit.register(stop_pool)
+    return _pool
+
+
+def stop_pool():
+    global _pool
+    if _pool is not None:
+        try:
+            get_embedder().stop_multi_process_pool(_pool)
+        finally:
+            _pool = None
+
+
+def model_key() -> str:
+    """Identifies everything that changes the vectors; used to namespace the embedding cache.
+
+    Besides the model, the runtime (quantized and ONNX vectors differ slightly from
+    fp32) and the sequence length (longer inputs are cut) are part of the key.
+    """
+    key = MODEL_NAME
+    if EMBED_RUNTIME != "torch":
+        key += f"@{EMBED_RUNTIME}"
+    if EMBED_MAX_SEQ_LENGTH:
+        key += f":{EMBED_MAX_SEQ_LENGTH}"
+    return key
+
+
+def encode(texts: List[str], batch_size: int = 32, use_cache: bool = True) -> np.ndarray:
+    """Encode texts and return a float32 array aligned with the input order.
+
+    Texts already in the on-disk embedding cache (keyed by model and content digest)
+    are not re-encoded; the model is only loaded when at least one text misses.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    cache = get_embedding_cache(model_key()) if use_cache else None
+    if cache is None:
+        return _encode(texts, batch_size)
+
+    keys = [text_key(t) for t in texts]
+    cached = cache.get_many(keys)
+    missing = [i for i, v in enumerate(cached) if v is None]
+    if missing:
+        fresh = _encode([texts[i] for i in missing], batch_size)
+        cache.put_many([keys[i] for i in missing], fresh)
+        for i, v in zip(missing, fresh):
+            cached[i] = v
+    return np.stack(cached).astype(np.float32, copy=False)
+
+
+def _encode(texts: List[str], batch_size: int) -> np.ndarray:
+    """Embed texts through the shared embedding daemon when one serves this model, else locally."""
+    remote = encode_remote(texts, batch_size)
+    if remote is not None:
+        return remote
+    return encode_local(texts, batch_size)
+
+
+def encode_local(texts: List[str], batch_size: int) -> np.ndarray:
+    """Run the model over texts in this process.
+
+    Texts are sorted by token length before batching so each batch holds chunks of
+    similar size and little compute is spent on padding; the original order is
+    restored afterwards. With EMBED_PROCESSES > 1 the sorted batches are sharded
+    across worker processes.
+    """
+    embedder = get_embedder()
+    order = np.argsort(_lengths(embedder, texts), kind="stable")
+    ordered = [texts[i] for i in order]
+
+    # ONNX sessions cannot be shipped to worker processes
+    if EMBED_PROCESSES > 1 and EMBED_RUNTIME != "onnx" and len(ordered) > batch_size:
+        # chunk_size=batch_size keeps each worker's share length-homogeneous
+        vecs = embedder.encode_multi_process(ordered, _get_pool(embedder), batch_size=batch_size, chunk_size=batch_size)
+    else:
+        parts = [
+            embedder.encode(ordered[i:i + batch_size], batch_size=batch_size, show_progress_bar=False)
+            for i in range(0, len(ordered), batch_size)
+        ]
+        vecs = np.concatenate(parts)
+
+    out = np.empty_like(np.asarray(vecs, dtype=np.float32))
+    out[order] = vecs
+    return out
+
+
+def check_runtime(texts: List[str], batch_size: int = 32) -> dict:
+    """Compare the configured EMBED_RUNTIME with the fp32 torch model on texts.
+
+    Returns the cosine similarity between the two embeddings of each text (min and
+    mean) and the encoding time of both models after one warm-up batch.
+    """
+    models = {"runtime": get_embedder(), "fp32": load_embedder("torch")}
+    vecs, seconds = {}, {}
+    for name, model in models.items():
+        model.encode(texts[:batch_size], batch_size=batch_size, show_progress_bar=False)
+        start = time.perf_counter()
+        vecs[name] = np.asarray(
+            model.encode(texts, batch_size=batch_size, show_progress_bar=False, normalize_embeddings=True), dtype=np.float32
+        )
+        seconds[name] = time.perf_counter() - start
+    cos = np.sum(vecs["runtime"] * vecs["fp32"], axis=1)
+    return {
+        "runtime": EMBED_RUNTIME,
+        "texts": len(texts),
+        "min_cos": float(cos.min()),
+        "mean_cos": float(cos.mean()),
+        "seconds": seconds["runtime"],
+        "fp32_seconds": seconds["fp32"],
+        "speedup": seconds["fp32"] / max(seconds["runtime"], 1e-9),
+    }
@@ -0,0 +1,125 @@
+# Search filters (extension, language, directory, path glob) pushed down into the stores
+import os
+import re
+from config import CODE_DIR
+from utils import LANGUAGES, glob_to_regex
+from typing import Optional
+
+# bump when chunk_metadata changes; the index is rebuilt so every chunk carries the new fields
+METADATA_VERSION = 1
+# directory prefixes stored as dir1..dirN metadata, so a directory filter is one equality test
+DIR_DEPTH = 4
+_GLOB_CHARS = "*?["
+
+
+def relative_dir(path: str, root: str = CODE_DIR) -> str:
+    """Directory of path relative to the code root, '/'-separated ('' at the root)."""
+    rel = os.path.relpath(os.path.dirname(os.path.abspath(path)), os.path.abspath(root))
+    return "" if rel == "." else rel.replace(os.sep, "/")
+
+
+def chunk_metadata(path: str, start: int, end: int, root: str = CODE_DIR) -> dict:
+    """Metadata stored with each chunk: its span plus extension, language and directory."""
+    ext = os.path.splitext(path)[1].lower()
+    d = relative_dir(path, root)
+    meta = {
+        "source": path,
+        "start_line": start,
+        "end_line": end,
+        "ext": ext,
+        "lang": LANGUAGES.get(ext, ext.lstrip(".") or "text"),
+        "dir": d,
+    }
+    parts = d.split("/") if d else []
+    for depth in range(1, min(len(parts), DIR_DEPTH) + 1):
+        meta[f"dir{depth}"] = "/".join(parts[:depth])
+    return meta
+
+
+def normalize_ext(ext: str = None) -> Optional[str]:
+    if not ext:
+        return None
+    if not ext.startswith("."):
+        ext = "." + ext
+    return ext.lower()
+
+
+class SearchFilter:
+    """Restricts a search to an extension, a language and/or a path under the code root.
+
+    `path` is a directory ("net/http") or a glob ("net/**/*.rs", "*_test.py"). The
+    parts a store can evaluate (extension, language, directory prefix up to
+    DIR_DEPTH levels) become `where`, in Chroma's filter syntax; `accept` is the
+    exact check for what `where` cannot express (deeper directories, globs).
+    """
+
+    def __init__(self, ext: str = None, path: str = None, lang: str = None, root: str = CODE_DIR):
+        self.ext = normalize_ext(ext)
+        self.lang = lang.lower() if lang else None
+        self.path = path or None
+        self.root = root
+        self.dir = None
+        self.regex = None
+        if path:
+            p = path.replace(os.sep, "/").strip()
+            while p.startswith("./"):
+                p = p[2:]
+            p = p.strip("/")
+            parts = p.split("/") if p else []
+            literal = []
+            for part in parts:
+                if any(c in part for c in _GLOB_CHARS):
+                    break
+                literal.append(part)
+            self.dir = "/".join(literal) or None
+            if len(literal) < len(parts):
+                last = parts[-1]
+                # '*.rs' as the last component is an extension filter the store can evaluate
+                if self.ext is None and re.fullmatch(r"\*\.\w+", last) and "**" not in parts[:-1] and len(literal) == len(parts) - 1:
+                    self.ext = last[1:].lower()
+                # like gitignore: a pattern without a slash matches at any depth
+                prefix = "" if "/" in p else "(?:.*/)?"
+                self.regex = re.compile(prefix + glob_to_regex(p))
+
+    def __bool__(self):
+        return bool(self.ext or self.lang or self.dir or self.regex)
+
+    def key(self) -> tuple:
+        return (self.ext, self.lang, self.path)
+
+    @property
+    def residual(self) -> bool:
+        """True when `where` is only an approximation and results still need `accept`."""
+        return self.regex is not None or (self.dir is not None and self.dir.count("/") >= DIR_DEPTH)
+
+    @property
+    def where(self) -> Optional[dict]:
+        conds = []
+        if self.ext:
+            conds.append({"ext": self.ext})
+        if self.lang:
+            conds.append({"lang": self.lang})
+        if self.dir:
+            parts = self.dir.split("/")
+            depth = min(len(parts), DIR_DEPTH)
+            conds.append({f"dir{depth}": "/".join(parts[:depth])})
+        if not conds:
+            return None
+        return conds[0] if len(conds) == 1 else {"$and": conds}
+
+    def accept(self, path: str) -> bool:
+        if not path:
+            return False
+        ext = os.path.splitext(path)[1].lower()
+        if self.ext and ext != self.ext:
+            return False
+        if self.lang and LANGUAGES.get(ext, ext.lstrip(".")) != self.lang:
+            return False
+        if self.dir or self.regex:
+            d = relative_dir(path, self.root)
+            if self.dir and not (d == self.dir or d.startswith(self.dir + "/")):
+                return False
+            rel = f"{d}/{os.path.basename(path)}" if d else os.path.basename(path)
+            if self.regex and not self.regex.fullmatch(rel):
+                return False
+        return True
@@ -0,0 +1,177 @@
+# Non-interactive entry points: `diver.py index`, `search`, `check-embed` and `embed-server` (no TTY, no Ollama)
+import argparse
+import contextlib
+import json
+import random
+import select
+import sys
+from typing import Iterable, List
+
+
+def _batches(lines: Iterable[str], size: int):
+    batch: List[str] = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _stdin_lines(size: int):
+    """Yield stdin lines in groups of whatever is already available (at most size).
+
+    Bulk input is batched for throughput while a caller writing one query at a
+    time still gets each answer right away.
+    """
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            return
+        group = [line]
+        while len(group) < size and select.select([sys.stdin], [], [], 0)[0]:
+            line = sys.stdin.readline()
+            if not line:
+                break
+            group.append(line)
+        yield group
+
+
+def _cmd_index(args):
+    from indexer import index_workspace
+
+    index_workspace(full=args.full, roots=args.root)
+    return 0
+
+
+def _cmd_search(args):
+    out = sys.stdout
+    # progress messages ("Loading embedding model...", indexing summaries) go to stderr
+    # so stdout carries only results
+    with contextlib.redirect_stdout(sys.stderr):
+        _search(args, out)
+    return 0
+
+
+def _search(args, out):
+    from indexer import ensure_index
+    from search import search_code_many
+
+    ensure_index(args.root)
+    groups = _stdin_lines(args.batch) if args.queries == ["-"] else [args.queries]
+    for batch in (b for group in groups for b in _batches(group, args.batch)):
+        for query, matches in zip(batch, search_code_many(batch, ext=args.ext, mode=args.mode, path=args.path, root=args.root)):
+            if args.json:
+                results = [
+                    {"location": loc, "snippet": snippet, "distance": None if dist is None else float(dist)}
+                    for loc, snippet, dist in matches
+                ]
+                out.write(json.dumps({"query": query, "results": results}) + "\n")
+            else:
+                out.write(f"# {query}\n")
+                for loc, snippet, dist in matches:
+                    out.write(f"{loc}\n")
+                out.write("\n")
+        # stream: each batch is visible to the reader as soon as it is answered
+        out.flush()
+
+
+def _cmd_check_embed(args):
+    from chunker import chunk_file
+    from config import select_roots
+    from encoder import check_runtime
+    from utils import get_code_files, read_file
+
+    # a sample of real chunks from the workspace, spread over more files than needed
+    texts = []
+    for root in select_roots(args.root):
+        for fp in get_code_files(root):
+            texts += [c[0] for c in chunk_file(fp, read_file(fp))]
+            if len(texts) >= args.sample * 4:
+                break
+    if not texts:
+        print("No code files to sample.", file=sys.stderr)
+        return 1
+    texts = random.Random(0).sample(texts, min(args.sample, len(texts)))
+    with contextlib.redirect_stdout(sys.stderr):
+        r = check_runtime(texts)
+    ok = r["min_cos"] >= args.min_cos
+    if args.json:
+        print(json.dumps(dict(r, ok=ok)))
+    else:
+        print(f"{r['runtime']} vs fp32 on {r['texts']} chunks: cosine min {r['min_cos']:.4f}, mean {r['mean_cos']:.4f}")
+        print(f"encode: {r['seconds']:.2f} s vs {r['fp32_seconds']:.2f} s fp32 ({r['speedup']:.1f}x)")
+        if not ok:
+            print(f"min cosine below {args.min_cos}")
+    return 0 if ok else 1
+
+
+def _cmd_embed_server(args):
+    import embed_daemon
+
+    if args.status:
+        st = embed_daemon.status(args.socket)
+        if st is None:
+            print(f"No embedding daemon on {args.socket}", file=sys.stderr)
+            return 1
+        print(json.dumps(st))
+        return 0
+    try:
+        embed_daemon.serve(args.socket, batch_size=args.batch_size)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="diver.py", description="Run without arguments for the interactive CLI.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("index", help="index the codebase (incremental) and exit")
+    p.add_argument("--full", action="store_true", help="ignore the manifest and rebuild everything")
+    p.add_argument("--root", default=None, help="only index these workspace roots (comma-separated names)")
+    p.set_defaults(func=_cmd_index)
+
+    p = sub.add_parser("search", help="search the index; '-' reads one query per line from stdin")
+    p.add_argument("queries", nargs="+", help="queries, or '-' for stdin")
+    p.add_argument("--json", action="store_true", help="print one JSON object per query")
+    p.add_argument("--ext", default=None, help="only return files with this extension")
+    p.add_argument("--path", default=None, help="only search this directory or glob under each root")
+    p.add_argument("--root", default=None, help="only search these workspace roots (comma-separated names)")
+    p.add_argument("--mode", choices=("hybrid", "lexical", "vector"), default=None)
+    p.add_argument("--batch", type=int, default=64, help="queries embedded and searched together")
+    p.set_defaults(func=_cmd_search)
+
+    p = sub.add_parser("check-embed", help="compare EMBED_RUNTIME with the fp32 model (cosine parity and speed)")
+    p.add_argument("--sample", type=int, default=128, help="chunks sampled from the workspace")
+    p.add_argument("--min-cos", type=float, default=0.98, help="exit 1 if any chunk's cosine similarity is lower")
+    p.add_argument("--root", default=None, help="sample these workspace roots (comma-separated names)")
+    p.add_argument("--json", action="store_true", help="print one JSON object")
+    p.set_defaults(func=_cmd_check_embed)
+
+    from config import EMBED_SOCKET
+
+    p = sub.add_parser("embed-server", help="serve embeddings to every Diver process on this machine")
+    p.add_argument("--socket", default=EMBED_SOCKET, help="Unix socket to listen on")
+    p.add_argument("--batch-size", type=int, default=32, help="texts per forward pass")
+    p.add_argument("--status", action="store_true", help="print the running daemon's counters and exit")
+    p.set_defaults(func=_cmd_embed_server)
+    return parser
+
+
+def run(argv: List[str]) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "root", None):
+        from config import select_roots
+
+        try:
+            select_roots(args.root)
+        except ValueError as e:
+            parser.error(str(e))
+    return args.func(args)
@@ -1,9 +1,30 @@
 # Code indexing functions
 
-from config import CODE_DIR, get_embedder, get_collection
-from utils import get_code_files, read_file, chunk_text
+import json
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config import CODE_DIR, CHUNK_TOKENS, CHUNK_OVERLAP_LINES, EMBED_PROCESSES, EMBED_SORT_WINDOW, VECTOR_BACKEND, get_index_dir, select_roots
+from encoder import encode, model_key
+from embed_cache import flush_all as flush_embedding_cache
+from query_cache import bump_generation
+from manifest import Manifest, MANIFEST_FILE, chunk_id, content_digest, file_stat
+from chunker import chunk_file, CHUNKER_VERSION
+from filters import METADATA_VERSION, chunk_metadata
+from symbols import get_symbol_index
+from lexical import get_lexical_index
+from trigram import get_trigram_index
+from store import VectorStore, get_store
+from utils import CodeFileFilter, get_code_files, read_file
 from typing import List
 
+STORE_INFO_FILE = "store.json"
+
+# serializes writers (`:index`, the file watcher) over the manifest and vector store
+_index_lock = threading.RLock()
+
 
 def _batch(iterable, size: int):
     batch = []
@@ -16,35 +37,254 @@ def _batch(iterable, size: int):
         yield batch
 
 
-def index_codebase(batch_size: int = 32):
-    """Index the codebase in batches. This batches embedding calls and collection.add
-    calls which is much faster than adding one document at a time.
+def _side_indexes(root: str = CODE_DIR) -> list:
+    """Per-root indexes kept in step with the embeddings.
 
-    Args:
-        batch_size: number of chunks to encode per batch.
+    Each provides extract(path, text, chunks) (run on the reader pool),
+    update(path, extracted, ids), remove(path), clear() and commit(), plus
+    `name`/`version` recorded in store.json.
+    """
+    return [get_symbol_index(root), get_lexical_index(root), get_trigram_index(root)]
+
+
+def _prepare_file(fp: str, old_digest: str = None, side: list = ()):
+    """Read, chunk and run side-index extraction for one file.
+
+    chunks is None when the content did not change. st is the file's size and mtime
+    from before the read, for the manifest.
+    """
+    st = file_stat(fp)
+    content = read_file(fp)
+    digest = content_digest(content)
+    if digest == old_digest:
+        return fp, st, digest, None, None
+    chunks = chunk_file(fp, content)
+    return fp, st, digest, chunks, [idx.extract(fp, content, chunks) for idx in side]
+
+
+def _read_ahead(files: List[str], manifest: Manifest, workers: int, side: list, depth: int = 64):
+    """Yield _prepare_file results in order, keeping at most `depth` files in flight."""
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for fp in files:
+            entry = manifest.files.get(fp)
+            pending.append(pool.submit(_prepare_file, fp, entry["digest"] if entry else None, side))
+            if len(pending) >= depth:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class _Writer(threading.Thread):
+    """Applies deletes and upserts to the vector store in order on its own thread.
+
+    The queue is small so the encoder can run at most a couple of batches ahead.
     """
-    print("Indexing codebase...")
-    files = get_code_files(CODE_DIR)
-    embedder = get_embedder()
-    collection = get_collection()
-
-    # list of tuples (chunk_text, source, id)
-    chunks = []      
-    for fp in files:
-        content = read_file(fp)
-        for chunk in chunk_text(content):
-            chunks.append((chunk, fp, f"{fp}-{hash(chunk)}"))
+
+    def __init__(self, store: VectorStore, depth: int = 2):
+        super().__init__(daemon=True)
+        self.store = store
+        self.queue = queue.Queue(maxsize=depth)
+        self.error = None
+
+    def delete(self, ids: List[str]):
+        if ids:
+            self.queue.put(("delete", ids))
+
+    def add(self, docs, embeddings, metadatas, ids):
+        self.queue.put(("add", docs, embeddings, metadatas, ids))
+
+    def close(self):
+        """Wait for queued writes and re-raise the first error from the writer thread."""
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                # keep draining so producers never block on a dead writer
+                continue
+            try:
+                if item[0] == "delete":
+                    for batch in _batch(item[1], 512):
+                        self.store.delete(batch)
+                else:
+                    _, docs, embeddings, metadatas, ids = item
+                    # ids are content-derived, so upsert keeps a re-run after an interrupted index idempotent
+                    self.store.upsert(ids, embeddings, docs, metadatas)
+            except Exception as e:
+                self.error = e
+
+
+def _store_info(root: str = CODE_DIR) -> dict:
+    """What the persisted index was built with; a mismatch forces a rebuild."""
+    return {
+        "model": model_key(),
+        "backend": VECTOR_BACKEND,
+        "metadata": METADATA_VERSION,
+        "chunker": [CHUNKER_VERSION, CHUNK_TOKENS, CHUNK_OVERLAP_LINES],
+        "indexes": {idx.name: idx.version for idx in _side_indexes(root)},
+    }
+
+
+def _read_store_info(root: str = CODE_DIR) -> dict:
+    try:
+        with open(os.path.join(get_index_dir(root), STORE_INFO_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_store_info(root: str = CODE_DIR):
+    with open(os.path.join(get_index_dir(root), STORE_INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump(_store_info(root), f)
+
+
+def index_is_stale(root: str = CODE_DIR) -> bool:
+    """True when the persisted index was built with another model (or runtime), chunker or backend."""
+    return _read_store_info(root) != _store_info(root)
+
+
+def ensure_index(roots=None):
+    """Load the persisted index of each workspace root, (re)building only the empty or stale ones."""
+    for root in select_roots(roots):
+        if index_is_stale(root) or get_store(root).count() == 0:
+            index_codebase(root=root)
+
+
+def _manifest_path(root: str = CODE_DIR) -> str:
+    return os.path.join(get_index_dir(root), MANIFEST_FILE)
+
+
+def _reindex(store: VectorStore, manifest: Manifest, stale: List[str], removed: List[str], batch_size: int, workers: int, root: str = CODE_DIR):
+    """Delete chunks of removed files and re-embed the stale ones. Returns (chunks, files) written."""
+    side = _side_indexes(root)
+    writer = _Writer(store)
+    writer.start()
+
+    for fp in removed:
+        writer.delete(manifest.remove(fp))
+        for idx in side:
+            idx.remove(fp)
 
     total = 0
-    for batch in _batch(chunks, batch_size):
+    changed = 0
+    batch = []
+    # encode several batches at once so they can be length-sorted (and spread over worker processes)
+    window = batch_size * max(EMBED_SORT_WINDOW, 2 * EMBED_PROCESSES, 1)
+
+    def flush():
+        nonlocal total
+        # the model is only loaded here, i.e. when something actually changed
         docs: List[str] = [c[0] for c in batch]
-        metadatas = [{"source": c[1]} for c in batch]
-        ids = [c[2] for c in batch]
+        embeddings = encode(docs, batch_size=batch_size)
+        writer.add(docs, embeddings, [c[1] for c in batch], [c[2] for c in batch])
+        total += len(docs)
+        batch.clear()
 
-        # encode in one call for better throughput
-        embeddings = embedder.encode(docs, show_progress_bar=False)
+    try:
+        # files are read and chunked on the pool while this thread encodes and the
+        # writer thread stores the previous batch
+        for fp, st, digest, chunks, extracted in _read_ahead(stale, manifest, workers, side):
+            if chunks is None:
+                # touched but identical: refresh size/mtime only
+                manifest.update(fp, digest, st=st)
+                continue
+            # queue the old chunks for deletion before any new chunk of this file is written
+            writer.delete(manifest.remove(fp))
+            ids = []
+            for i, (chunk, start, end) in enumerate(chunks):
+                cid = chunk_id(fp, i, chunk)
+                batch.append((chunk, chunk_metadata(fp, start, end, root), cid))
+                ids.append(cid)
+                if len(batch) >= window:
+                    flush()
+            manifest.update(fp, digest, ids, st)
+            for idx, data in zip(side, extracted):
+                idx.update(fp, data, ids)
+            changed += 1
+        if batch:
+            flush()
+    finally:
+        writer.close()
+        store.persist()
+        flush_embedding_cache()
+        for idx in side:
+            idx.commit()
 
-        collection.add(documents=docs, embeddings=embeddings, metadatas=metadatas, ids=ids)
-        total += len(docs)
+    manifest.save()
+    if total or changed or removed:
+        # cached search results no longer reflect the index
+        bump_generation()
+    return total, changed
+
+
+def index_codebase(batch_size: int = 32, full: bool = False, workers: int = 4, root: str = CODE_DIR):
+    """Index one code root incrementally. Only files that were added or changed since
+    the last run (per the manifest) are re-chunked and re-embedded; chunks of changed
+    and removed files are deleted from the vector store.
 
-    print(f"Indexed {total} chunks from {len(files)} files into vector DB.")
+    Indexing is streamed: a thread pool reads and chunks files, this thread encodes
+    a window of length-sorted batches and a writer thread stores them, so memory stays
+    bounded by a few windows regardless of repository size.
+
+    Args:
+        batch_size: number of chunks to encode per batch.
+        full: ignore the manifest and rebuild every file.
+        workers: number of threads reading and chunking files.
+        root: the code root; each root has its own manifest, vector store and side indexes.
+    """
+    print(f"Indexing {root}...")
+    files = get_code_files(root)
+    with _index_lock:
+        manifest = Manifest.load(_manifest_path(root))
+
+        store = get_store(root)
+        if full or index_is_stale(root):
+            # a different model may change the embedding dimension, so start from an empty store
+            store.reset()
+            manifest.clear()
+            bump_generation()
+        if store.count() == 0:
+            # the store does not hold what the manifest describes (e.g. a fresh store)
+            manifest.clear()
+        if not manifest.files:
+            for idx in _side_indexes(root):
+                idx.clear()
+
+        stale, removed = manifest.diff(files)
+        total, changed = _reindex(store, manifest, stale, removed, batch_size, workers, root)
+        _write_store_info(root)
+
+    print(f"Indexed {total} chunks from {changed} changed files "
+          f"({len(files)} tracked, {len(removed)} removed) into vector DB.")
+
+
+def index_workspace(full: bool = False, roots=None):
+    """Index the workspace roots (all of them, or the named ones) one after another."""
+    for root in select_roots(roots):
+        index_codebase(full=full, root=root)
+
+
+def index_paths(paths: List[str], batch_size: int = 32, workers: int = 2, root: str = CODE_DIR):
+    """Re-index only the given files of a root (e.g. from the file watcher) without walking the tree.
+
+    Paths are held to the same rules as a walk of the root (extension, ignore files,
+    MAX_FILE_BYTES, binary content); paths that no longer exist or that the rules
+    now exclude have their chunks removed. Returns (chunks, changed, removed).
+    """
+    accepts = CodeFileFilter(root)
+    with _index_lock:
+        manifest = Manifest.load(_manifest_path(root))
+        existing = [p for p in paths if os.path.isfile(p) and accepts(p)]
+        removed = [p for p in paths if p not in existing and p in manifest.files]
+        stale, _ = manifest.diff(existing)
+        if not stale and not removed:
+            return 0, 0, 0
+        total, changed = _reindex(get_store(root), manifest, stale, removed, batch_size, workers, root)
+    return total, changed, len(removed)
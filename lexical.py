@@ -0,0 +1,161 @@
+# Identifier-aware BM25 inverted index stored next to the vector store
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from config import CODE_DIR, get_index_dir
+from typing import Callable, Dict, List, Optional, Tuple
+
+LEXICAL_VERSION = 1
+LEXICAL_FILE = "lexical.db"
+
+_WORD_RE = re.compile(r"\w+")
+_PART_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+# (chunk_id, path, start_line, end_line, score)
+LexicalHit = Tuple[str, str, int, int, float]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words plus the camelCase/snake_case parts of identifiers.
+
+    'getUserName' -> getusername, get, user, name; 'MAX_FILE_BYTES' -> max_file_bytes, max, file, bytes.
+    """
+    out = []
+    for word in _WORD_RE.findall(text):
+        if len(word) > 1:
+            out.append(word.lower())
+        parts = [p for seg in word.split("_") for p in _PART_RE.findall(seg)]
+        if len(parts) > 1:
+            out.extend(p.lower() for p in parts if len(p) > 1)
+    return out
+
+
+class LexicalIndex:
+    """BM25 over indexed chunks, kept in SQLite.
+
+    `postings` is a WITHOUT ROWID table clustered on (term, doc), so a term's
+    postings list is one contiguous range. Plugs into the indexer as a side index.
+    """
+
+    name = "lexical"
+    version = LEXICAL_VERSION
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS docs (id INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE, path TEXT, start_line INTEGER, end_line INTEGER, length INTEGER)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS docs_path ON docs(path)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT, doc INTEGER, tf INTEGER, PRIMARY KEY (term, doc)) WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings(doc)")
+        self.db.commit()
+        self._stats = None
+
+    # side-index protocol
+
+    def extract(self, path: str, text: str, chunks):
+        return [(Counter(tokenize(chunk)), start, end) for chunk, start, end in chunks]
+
+    def update(self, path: str, data, ids: List[str]):
+        with self.lock:
+            self.remove(path)
+            for cid, (counts, start, end) in zip(ids, data):
+                cur = self.db.execute(
+                    "INSERT INTO docs (chunk_id, path, start_line, end_line, length) VALUES (?, ?, ?, ?, ?)",
+                    (cid, path, start, end, sum(counts.values())),
+                )
+                doc = cur.lastrowid
+                self.db.executemany("INSERT INTO postings VALUES (?, ?, ?)", [(t, doc, tf) for t, tf in counts.items()])
+
+    def remove(self, path: str):
+        with self.lock:
+            self.db.execute("DELETE FROM postings WHERE doc IN (SELECT id FROM docs WHERE path = ?)", (path,))
+            self.db.execute("DELETE FROM docs WHERE path = ?", (path,))
+            self._stats = None
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM postings")
+            self.db.execute("DELETE FROM docs")
+            self._stats = None
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+
+    # search
+
+    def stats(self) -> Tuple[int, float]:
+        with self.lock:
+            if self._stats is None:
+                n, avg = self.db.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+                self._stats = (n or 0, avg or 0.0)
+            return self._stats
+
+    def search(self, query: str, k: int = 10, ext: str = None, accept: Optional[Callable[[str], bool]] = None) -> List[LexicalHit]:
+        """Top-k chunks by BM25 for the query's identifier-aware terms.
+
+        ext and accept(path) restrict the paths returned.
+        """
+        terms = set(tokenize(query))
+        n, avgdl = self.stats()
+        if not terms or not n:
+            return []
+        scores: Dict[int, float] = {}
+        with self.lock:
+            dfs = {t: self.db.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (t,)).fetchone()[0] for t in terms}
+            # very common terms barely move BM25 but cost the most to scan
+            useful = [t for t in terms if 0 < dfs[t] <= n // 2] or [t for t in terms if dfs[t]]
+            for t in useful:
+                idf = math.log(1 + (n - dfs[t] + 0.5) / (dfs[t] + 0.5))
+                rows = self.db.execute(
+                    "SELECT p.doc, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc WHERE p.term = ?", (t,)
+                )
+                for doc, tf, length in rows:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avgdl)
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1) / norm
+            if not scores:
+                return []
+            ranked = sorted(scores.items(), key=lambda kv: -kv[1])
+            out = []
+            for i in range(0, len(ranked), 500):
+                # fetch in slices until k docs survive the filters
+                part = ranked[i:i + 500]
+                ids = [d for d, _ in part]
+                rows = self.db.execute(
+                    f"SELECT id, chunk_id, path, start_line, end_line FROM docs WHERE id IN ({','.join('?' * len(ids))})", ids
+                )
+                meta = {r[0]: r[1:] for r in rows}
+                for doc, score in part:
+                    cid, path, start, end = meta[doc]
+                    if ext and not path.lower().endswith(ext):
+                        continue
+                    if accept is not None and not accept(path):
+                        continue
+                    out.append((cid, path, start, end, score))
+                    if len(out) >= k:
+                        return out
+            return out
+
+
+_indexes: Dict[str, LexicalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_lexical_index(code_dir: str = CODE_DIR) -> LexicalIndex:
+    """Return the BM25 index stored in the code root's index dir."""
+    path = os.path.join(get_index_dir(code_dir), LEXICAL_FILE)
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = LexicalIndex(path)
+        return _indexes[path]
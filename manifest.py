@@ -0,0 +1,99 @@
+# Per-file index manifest (path -> size, mtime, digest, chunk ids)
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Tuple
+
+MANIFEST_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+
+def content_digest(text: str) -> str:
+    """Stable digest of a text blob (unlike hash(), not salted per process)."""
+    return hashlib.sha1(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def chunk_id(path: str, index: int, chunk: str) -> str:
+    """Content-derived chunk id; the position keeps repeated chunks in one file distinct."""
+    return f"{path}:{index}:{content_digest(chunk)[:16]}"
+
+
+def file_stat(fp: str):
+    """(size, mtime_ns) of fp, or None when it cannot be stat'ed."""
+    try:
+        st = os.stat(fp)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class Manifest:
+    """Tracks what was indexed for every file so `:index` only redoes changed files.
+
+    Each entry is {"size", "mtime", "digest", "ids"} where ids are the chunk ids
+    written to the collection for that file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, dict] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "Manifest":
+        m = cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                m.files = data.get("files", {})
+        except (OSError, ValueError):
+            pass
+        return m
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        self.files = {}
+
+    def diff(self, paths: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Return (stale, removed).
+
+        stale are files that are new or whose size/mtime changed; their content
+        digest still has to be compared by the caller. removed are manifest
+        entries that no longer exist on disk.
+        """
+        seen = set()
+        stale = []
+        for fp in paths:
+            seen.add(fp)
+            entry = self.files.get(fp)
+            st = file_stat(fp)
+            if entry is None or st is None or (entry["size"], entry["mtime"]) != st:
+                stale.append(fp)
+        removed = [fp for fp in self.files if fp not in seen]
+        return stale, removed
+
+    def update(self, fp: str, digest: str, ids: List[str] = None, st=None):
+        """Record fp as indexed. ids=None keeps the previous chunk ids (touch only).
+
+        st is file_stat(fp) taken before the content behind digest was read, so a
+        write that lands while the file is being indexed leaves a stale size/mtime
+        and the next diff picks the file up again.
+        """
+        st = st or (0, 0)
+        prev = self.files.get(fp, {})
+        self.files[fp] = {
+            "size": st[0],
+            "mtime": st[1],
+            "digest": digest,
+            "ids": prev.get("ids", []) if ids is None else ids,
+        }
+
+    def remove(self, fp: str) -> List[str]:
+        """Drop fp and return the chunk ids that belonged to it."""
+        entry = self.files.pop(fp, None)
+        return entry.get("ids", []) if entry else []
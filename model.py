@@ -1,27 +1,212 @@
-import subprocess
+import http.client
 import json
+import queue
+import socket
+import sys
+import threading
 import time
-from utils import cyan, green, grey, blue
+from urllib.parse import urlsplit
+from answer_cache import answer_key, get_answer_cache
+from config import OLLAMA_KEEP_ALIVE, OLLAMA_MODEL, OLLAMA_POOL_SIZE, OLLAMA_TIMEOUT, OLLAMA_URL, SESSION_KEEP_TURNS, SESSION_MAX_TOKENS
+from typing import Callable, List, Optional, Tuple
+from utils import grey
 
-def ask_model(query: str, context: str, model: str = "qwen3:8b") -> str:
+
+class OllamaError(RuntimeError):
+    """Ollama is not reachable or answered with an error."""
+
+
+class Cancel:
+    """Cancels one running generation; set() is safe from a signal handler or another thread.
+
+    Besides flagging the stream, set() shuts the connection's socket down, so a
+    read blocked on the first token returns at once and Ollama stops generating
+    when it sees the client go away.
     """
-    Send a structured prompt to a local Ollama model (default: qwen3:8b).
 
-    Args:
-        query (str): The user's question or request.
-        context (str): Relevant project or code context to help model reasoning.
-        model (str): The Ollama model tag to use (e.g. 'llama3', 'mistral', etc.)
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._conn: Optional[http.client.HTTPConnection] = None
 
-    Returns:
-        str: The model's response text or an error message.
+    def set(self):
+        self._event.set()
+        with self._lock:
+            if self._conn is not None and self._conn.sock is not None:
+                try:
+                    self._conn.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def is_set(self) -> bool:
+        return self._event.is_set()
+
+    def _attach(self, conn: Optional[http.client.HTTPConnection]):
+        with self._lock:
+            self._conn = conn
+
+
+class OllamaClient:
+    """Talks to Ollama's REST API over a small pool of keep-alive HTTP connections.
+
+    A connection goes back to the pool only after its response was read to the
+    end; a cancelled or failed stream closes it instead.
     """
-    if not query.strip():
-        return print("no_query")
 
+    def __init__(self, url: str = OLLAMA_URL, pool_size: int = OLLAMA_POOL_SIZE, timeout: float = OLLAMA_TIMEOUT):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 11434
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=max(1, pool_size))
+
+    def _connection(self) -> http.client.HTTPConnection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _release(self, conn: http.client.HTTPConnection):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _open(self, path: str, body: dict, cancel: Optional[Cancel] = None):
+        """(connection, response) for a POST; a pooled connection the server already closed is retried once."""
+        data = json.dumps(body).encode("utf-8")
+        for attempt in range(2):
+            # the retry always dials a new connection
+            conn = self._connection() if attempt == 0 else http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            reused = conn.sock is not None
+            if cancel is not None:
+                cancel._attach(conn)
+            try:
+                conn.request("POST", path, body=data, headers={"Content-Type": "application/json"})
+                resp = conn.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if reused and not (cancel and cancel.is_set()):
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if resp.status != 200:
+                detail = resp.read().decode("utf-8", "replace")
+                conn.close()
+                try:
+                    detail = json.loads(detail).get("error", detail)
+                except (ValueError, AttributeError):
+                    pass
+                raise OllamaError(f"Ollama returned HTTP {resp.status}: {detail}")
+            return conn, resp
+        raise OllamaError("Ollama closed the connection")
+
+    def stream(
+        self,
+        prompt: str,
+        model: str = OLLAMA_MODEL,
+        on_token: Optional[Callable[[str], None]] = None,
+        cancel: Optional[Cancel] = None,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        context: Optional[List[int]] = None,
+    ) -> Tuple[str, Optional[List[int]]]:
+        """Stream a completion of prompt, calling on_token with each piece as it arrives.
+
+        context is Ollama's token state returned by an earlier answer; Ollama keeps
+        the KV cache of the loaded model, so only the tokens after the shared prefix
+        are prefilled. Returns the text generated so far (partial when cancel was
+        set) and the state after this answer (None when the stream ended without it).
+        """
+        body = {"model": model, "prompt": prompt, "stream": True, "keep_alive": keep_alive}
+        if context:
+            body["context"] = context
+        try:
+            conn, resp = self._open("/api/generate", body, cancel)
+        except OSError as e:
+            if cancel is not None and cancel.is_set():
+                return "", None
+            raise OllamaError(f"Cannot reach Ollama at {self.host}:{self.port}: {e}") from e
+        pieces = []
+        done = False
+        state = None
+        try:
+            # one JSON object per line until {"done": true}
+            for line in resp:
+                if cancel is not None and cancel.is_set():
+                    break
+                if not line.strip():
+                    continue
+                msg = json.loads(line)
+                if "error" in msg:
+                    raise OllamaError(msg["error"])
+                piece = msg.get("response", "")
+                if piece:
+                    pieces.append(piece)
+                    if on_token is not None:
+                        on_token(piece)
+                if msg.get("done"):
+                    done = True
+                    state = msg.get("context")
+                    break
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            if cancel is None or not cancel.is_set():
+                conn.close()
+                raise OllamaError(f"Lost the connection to Ollama: {e}") from e
+        finally:
+            if cancel is not None:
+                cancel._attach(None)
+        if done:
+            # drain the end of the chunked body so the connection can be reused
+            resp.read()
+            self._release(conn)
+        else:
+            conn.close()
+        return "".join(pieces), state
+
+    def preload(self, model: str = OLLAMA_MODEL, wait: float = 10.0, keep_alive=OLLAMA_KEEP_ALIVE) -> bool:
+        """Load model into memory ahead of the first question, waiting up to wait seconds for the server."""
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                # a request without a prompt only loads the model
+                conn, resp = self._open("/api/generate", {"model": model, "keep_alive": keep_alive})
+                resp.read()
+                self._release(conn)
+                return True
+            except OllamaError:
+                return False
+            except OSError:
+                # the server may still be starting
+                if time.monotonic() > deadline:
+                    return False
+                time.sleep(0.5)
+
+
+_client: Optional[OllamaClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> OllamaClient:
+    """The process-wide Ollama client (and with it, its connection pool)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OllamaClient()
+    return _client
+
+
+# bump when the prompts below change, so cached answers to the old prompts are not served
+PROMPT_VERSION = 1
+
+
+def _prompt(query: str, context: str, recap: str = "") -> str:
+    """The opening prompt of a conversation: system preamble, earlier turns (if any), question and context."""
     # system + user prompt
-    prompt = f"""
+    return f"""
 You are a coding assistant with access to project context.
-
+{recap}
 User question:
 {query}
 
@@ -30,45 +215,162 @@ Relevant code context:
 
 Answer concisely and clearly.
 """
+
+
+def _follow_up(query: str, context: str) -> str:
+    """A later turn: the model already holds the preamble, earlier answers and the code sent with them."""
+    if not context.strip():
+        return f"\nFollow-up question:\n{query}\n"
+    return f"\nFollow-up question:\n{query}\n\nAdditional code context:\n{context}\n"
+
+
+class Session:
+    """A multi-turn conversation that continues from Ollama's token state instead of resending it.
+
+    Each answer's `context` (the tokens of the conversation so far) is sent with
+    the next question, so only the new turn is prefilled. seen holds the line
+    sets of code blocks the model was already given (see context.build_context),
+    so follow-ups only add new code. Once the state exceeds max_tokens it is
+    dropped, and the next turn starts over with a short recap of the last
+    keep_turns questions and answers.
+    """
+
+    def __init__(self, model: str = OLLAMA_MODEL, max_tokens: int = SESSION_MAX_TOKENS, keep_turns: int = SESSION_KEEP_TURNS):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.reset()
+
+    def reset(self):
+        self.state: Optional[List[int]] = None
+        self.turns: List[Tuple[str, str]] = []
+        self.seen: List[set] = []
+        self.evictions = 0
+
+    def prompt(self, query: str, context: str) -> str:
+        if self.state is not None:
+            return _follow_up(query, context)
+        return _prompt(query, context, self._recap())
+
+    def _recap(self) -> str:
+        if not self.turns:
+            return ""
+        lines = ["", "Earlier in this conversation:"]
+        for question, answer in self.turns[-self.keep_turns:]:
+            # answers are clipped; the recap only has to keep the thread
+            answer = answer if len(answer) <= 600 else answer[:600].rsplit(" ", 1)[0] + " ..."
+            lines += [f"Q: {question}", f"A: {answer}"]
+        return "\n".join(lines) + "\n"
+
+    def record(self, query: str, answer: str, state: Optional[List[int]], seen: List[set]):
+        """Keep a finished turn; a cancelled one (no state) leaves the conversation as it was."""
+        if state is None:
+            return
+        self.turns = (self.turns + [(query, answer)])[-max(1, self.keep_turns):]
+        if len(state) > self.max_tokens:
+            # evict: the next turn starts a fresh state with a recap and resends its code
+            self.state = None
+            self.seen = []
+            self.evictions += 1
+        else:
+            self.state = state
+            self.seen.extend(seen)
+
+    def stats(self) -> dict:
+        """Size of the conversation for `:cache`: turns kept, state tokens, evictions so far."""
+        return {"turns": len(self.turns), "tokens": len(self.state or []), "max_tokens": self.max_tokens, "evictions": self.evictions}
+
+
+def _age(seconds: float) -> str:
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return f"{int(seconds // size)}{unit}"
+    return f"{int(seconds)}s"
+
+
+def ask_model(
+    query: str,
+    context: str,
+    model: str = OLLAMA_MODEL,
+    cancel: Optional[Cancel] = None,
+    session: Optional[Session] = None,
+    seen: Optional[List[set]] = None,
+    use_cache: bool = True,
+) -> str:
+    """
+    Send a structured prompt to a local Ollama model and stream the answer to the terminal.
+
+    Args:
+        query (str): The user's question or request.
+        context (str): Relevant project or code context to help model reasoning.
+        model (str): The Ollama model tag to use (e.g. 'llama3', 'mistral', etc.)
+        cancel (Cancel): Set to stop the generation; the partial answer is returned.
+        session (Session): Continue this conversation (its model is used) and record the turn.
+        seen (list): Line sets of the code blocks in context, recorded in the session.
+        use_cache (bool): Answer from the on-disk answer cache when possible; False always
+            runs the model (the new answer still replaces the cached one).
+
+    Returns:
+        str: The model's response text or an error message.
+    """
+    if not query.strip():
+        return print("no_query")
+
+    if session is not None:
+        model = session.model
+        prompt, state = session.prompt(query, context), session.state
+        recap = session._recap() if state is None else ""
+    else:
+        prompt, state, recap = _prompt(query, context), None, ""
+
+    cache = get_answer_cache()
+    key = None
+    if cache is not None:
+        # same model, question, code and conversation so far: the same answer
+        key = answer_key(model, query, str(PROMPT_VERSION), context, recap, json.dumps(state or []))
+        hit = cache.get(key) if use_cache else None
+        if hit is not None:
+            answer, state, created = hit
+            print("🧠", answer)
+            print(grey(f"(cached answer from {_age(time.time() - created)} ago; prefix the question with --no-cache to ask again)\n"))
+            if session is not None:
+                session.record(query, answer, state, seen or [])
+            return answer
+
     start_time = time.time()
+    first_token = []
+
+    def _print_token(piece: str):
+        if not first_token:
+            first_token.append(time.time() - start_time)
+            sys.stdout.write("🧠 ")
+        sys.stdout.write(piece)
+        sys.stdout.flush()
 
     print(grey("\n🧩 Running inference..."))
     try:
-        # spawn the subprocess for ollama infer
-        process = subprocess.Popen(
-            ["ollama", "run", model],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-
-        # send prompt to model
-        stdout, stderr = process.communicate(input=prompt, timeout=180)
-        elapsed = round(time.time() - start_time, 2)
-        print("🧠", stdout)
-        print(grey((f"({elapsed}s)\n")))
-
-        # model error handling
-        if process.returncode != 0:
-            print("⚠️ Model process exited with error code:", process.returncode)
-            if stderr:
-                print("🪶 STDERR (excerpt):", stderr[:200])
-            return f"❌ Model process failed (code {process.returncode})."
-
-        if not stdout.strip():
-            return "⚠️ Model returned no output."
-
-        # parse structured json output
-        try:
-            return json.loads(stdout)
-        except json.JSONDecodeError:
-            # return plain text
-            return stdout.strip()
-
-    except subprocess.TimeoutExpired:
-        return "⏳ Model timed out after 180 seconds."
-    except FileNotFoundError:
-        return "❌ Ollama not found. Make sure it's installed and running (`ollama serve`)."
-    except Exception as e:
-        return f"❌ Unexpected error during inference: {e}"
+        answer, state = get_client().stream(prompt, model, on_token=_print_token, cancel=cancel, context=state)
+    except OllamaError as e:
+        if first_token:
+            print()
+        message = f"❌ {e}. Make sure Ollama is installed and running (`ollama serve`)."
+        print(message)
+        return message
+
+    elapsed = round(time.time() - start_time, 2)
+    if cancel is not None and cancel.is_set():
+        print(grey("\n(cancelled)"))
+    elif not first_token:
+        print("⚠️ Model returned no output.")
+        return "⚠️ Model returned no output."
+    else:
+        print()
+    if not (cancel is not None and cancel.is_set()):
+        if session is not None:
+            session.record(query, answer.strip(), state, seen or [])
+        if cache is not None and state is not None:
+            # only a finished answer: a stream that ended early carries no state
+            cache.put(key, model, query, answer.strip(), state)
+    if first_token:
+        print(grey(f"({elapsed}s, first token after {round(first_token[0], 2)}s)\n"))
+    return answer.strip()
@@ -0,0 +1,110 @@
+# Speculative retrieval while the user types: debounced background searches of the prompt text
+import asyncio
+import difflib
+import re
+from config import PREFETCH_DEBOUNCE_MS, PREFETCH_MIN_CHARS, PREFETCH_MIN_SIMILARITY
+from query_cache import normalize_query
+from typing import Callable, Optional, Tuple
+
+_WORD_RE = re.compile(r"\w+")
+# prefetches kept for the current prompt (the text being edited, plus a few earlier versions)
+_KEEP = 4
+
+
+def _words(text: str) -> Tuple[str, ...]:
+    return tuple(w.casefold() for w in _WORD_RE.findall(text))
+
+
+def similar(prefetched: str, query: str) -> bool:
+    """Whether query can use prefetched's results: the same words, or near-identical text (a typo fixed)."""
+    if _words(prefetched) == _words(query):
+        return True
+    a, b = normalize_query(prefetched).casefold(), normalize_query(query).casefold()
+    return difflib.SequenceMatcher(None, a, b).ratio() >= PREFETCH_MIN_SIMILARITY
+
+
+def _options(opts: dict) -> dict:
+    return {k: v for k, v in opts.items() if v is not None}
+
+
+class Prefetcher:
+    """Runs search on the prompt text once typing pauses, so results are ready on Enter.
+
+    Attach on_text_changed to the prompt buffer. After PREFETCH_DEBOUNCE_MS without
+    a change, parse(text) gives (query, options) to search, or None for text that
+    is not a search (commands, short input). Searches run on a worker thread, one
+    at a time; text typed meanwhile is searched next, skipping intermediate versions.
+    result() answers the submitted query from a finished or running prefetch
+    when similar() holds, otherwise it searches, also off the event loop.
+    """
+
+    def __init__(self, search: Callable, parse: Callable[[str], Optional[Tuple[str, dict]]], ready: Callable[[], bool] = lambda: True):
+        self.search = search
+        self.parse = parse
+        self.ready = ready
+        self.hits = 0
+        self.misses = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._pending: Optional[Tuple[str, dict]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._results = []
+
+    def on_text_changed(self, buffer):
+        """prompt_toolkit Buffer.on_text_changed handler (called on the event loop)."""
+        self.cancel()
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(PREFETCH_DEBOUNCE_MS / 1000, self._fire, buffer.text)
+
+    def cancel(self):
+        """Drop a scheduled prefetch (a running search finishes in the background)."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _fire(self, text: str):
+        self._timer = None
+        target = self.parse(text)
+        if target is None or len(target[0].strip()) < PREFETCH_MIN_CHARS or not self.ready():
+            return
+        query, opts = target[0], _options(target[1])
+        if self._find(query, opts) is not None:
+            return
+        self._pending = (query, opts)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._drain())
+
+    async def _drain(self):
+        while self._pending is not None:
+            query, opts = self._pending
+            self._pending = None
+            fut = asyncio.ensure_future(asyncio.to_thread(self.search, query, **opts))
+            self._results = (self._results + [(query, opts, fut)])[-_KEEP:]
+            try:
+                await fut
+            except Exception:
+                # raised again by result() if the query is submitted
+                pass
+
+    def _find(self, query: str, opts: dict) -> Optional[asyncio.Future]:
+        for prefetched, o, fut in reversed(self._results):
+            if o == opts and similar(prefetched, query):
+                return fut
+        return None
+
+    async def result(self, query: str, **opts):
+        """search(query, **opts) without blocking the event loop, reusing a matching prefetch."""
+        self.cancel()
+        self._pending = None
+        opts = _options(opts)
+        fut = self._find(query, opts)
+        # prefetches belong to this prompt only; the next one starts over
+        self._results = []
+        if fut is not None:
+            try:
+                res = await fut
+                self.hits += 1
+                return res
+            except Exception:
+                pass
+        self.misses += 1
+        return await asyncio.to_thread(self.search, query, **opts)
@@ -0,0 +1,66 @@
+# In-memory LRU caches for query embeddings and search results
+import threading
+from collections import OrderedDict
+from config import QUERY_CACHE_SIZE, RESULT_CACHE_SIZE
+
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def generation() -> int:
+    """Index generation; bumped whenever the indexer writes, which invalidates cached results."""
+    return _generation
+
+
+def bump_generation():
+    global _generation
+    with _generation_lock:
+        _generation += 1
+    # entries of older generations can never hit again
+    results.clear()
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split())
+
+
+class LRUCache:
+    """Thread-safe bounded mapping with hit/miss counters."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self.data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+# (model key, normalized query) -> embedding
+query_embeddings = LRUCache(QUERY_CACHE_SIZE)
+# (normalized query, ext, mode, top_k, generation) -> search results
+results = LRUCache(RESULT_CACHE_SIZE)
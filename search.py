@@ -1,7 +1,19 @@
-from config import TOP_K, get_embedder, get_collection, CODE_DIR
-from utils import get_code_files, read_file
+from config import TOP_K, SEARCH_MODE, SEARCH_THREADS, select_roots
+from concurrent.futures import ThreadPoolExecutor
+from encoder import encode, model_key
+from filters import SearchFilter, normalize_ext
+from query_cache import generation, normalize_query, query_embeddings, results as result_cache
+from lexical import get_lexical_index
+from store import get_store
+from symbols import get_symbol_index
+from utils import read_file, format_location
+from itertools import islice
+import heapq
 import re
-import os
+import threading
+
+_pool = None
+_pool_lock = threading.Lock()
 
 def _snippet_for_query(doc: str, query: str, window: int = 120, max_len: int = 400) -> str:
     """Return a short snippet from doc centered on the first occurrence of query (case-insensitive).
@@ -45,102 +57,148 @@ def _parse_code_query(query: str):
     return None
 
 
-def _extract_block_c_style(text: str, start_idx: int) -> str:
-    """Extract a brace-delimited block starting at or after start_idx (for C/C++/Java).
-    This is a best-effort extractor that finds the first '{' after start_idx and returns
-    until the matching '}' (handles simple nesting).
+def _read_span(path: str, start: int, end: int) -> str:
+    lines = read_file(path).splitlines()
+    return "\n".join(lines[start - 1:end])
+
+
+def _fan_out(fn, roots):
+    """[fn(root) for root in roots], run concurrently on the search pool when there are several."""
+    global _pool
+    if len(roots) == 1:
+        return [fn(roots[0])]
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(1, SEARCH_THREADS), thread_name_prefix="search")
+    return list(_pool.map(fn, roots))
+
+
+def _merge(lists, n: int, key):
+    """The best n of several lists that are each sorted by key."""
+    return list(islice(heapq.merge(*lists, key=key), n))
+
+
+def find_symbol(name: str, kind: str = None, ext: str = None, limit: int = 50, root=None):
+    """Look a symbol up in the persisted symbol tables (exact, then prefix, then fuzzy).
+
+    root names the workspace roots to search (default: all of them). Returns a
+    list of (location, definition_text, None) like search_code.
     """
-    n = len(text)
-    # find first '{' after start_idx
-    i = text.find("{", start_idx)
-    if i == -1:
-        # no braces: return a few lines
-        return '\n'.join(text[start_idx:start_idx+400].splitlines()[:40])
-    depth = 0
-    j = i
-    while j < n:
-        if text[j] == '{':
-            depth += 1
-        elif text[j] == '}':
-            depth -= 1
-            if depth == 0:
-                return text[start_idx:j+1]
-        j += 1
-    # fallback: return from start_idx to some reasonable length
-    return text[start_idx:start_idx+2000]
-
-
-def _search_files_for_symbol(kind: str, name: str, ext: str = None):
-    """Search source files for a symbol and return list of (path, snippet).
-
-    ext may be like '.cpp' or 'cpp' or None.
+    found = _fan_out(lambda r: get_symbol_index(r).find(name, kind=kind, ext=normalize_ext(ext), limit=limit), select_roots(root))
+    hits = [h for hs in found for h in hs][:limit]
+    return [(format_location(p, s, e), _read_span(p, s, e), None) for _, _, p, s, e in hits]
+
+
+def embed_queries(queries):
+    """Embeddings of several queries; the ones not memoized yet are encoded in one batch.
+
+    Memoized in memory and backed by the on-disk embedding cache.
     """
-    # normalize extension filter
-    exts = None
-    if ext:
-        if not ext.startswith('.'):
-            ext = '.' + ext
-        exts = [ext]
-
-    # include common code extensions
-    file_list = get_code_files(CODE_DIR, exts=(".py", ".c", ".cpp", ".cc", ".cxx", ".h", ".hpp", ".java", ".js", ".ts", ".rs"))
-    matches = []
-    for fp in file_list:
-        if exts and not fp.lower().endswith(tuple(exts)):
-            continue
-        content = read_file(fp)
-        if not content:
-            continue
-
-        if kind in ("struct", "class"):
-            # look for 'struct Name' or 'class Name'
-            pat = re.compile(rf"\b{kind}\s+{re.escape(name)}\b")
-            m = pat.search(content)
-            if m:
-                # find enclosing block
-                start = max(0, m.start() - 80)
-                block = _extract_block_c_style(content, start)
-                matches.append((fp, block))
-                continue
+    keys = [(model_key(), normalize_query(q)) for q in queries]
+    embs = [query_embeddings.get(key) for key in keys]
+    missing = [i for i, e in enumerate(embs) if e is None]
+    if missing:
+        for i, e in zip(missing, encode([queries[i] for i in missing])):
+            query_embeddings.put(keys[i], e)
+            embs[i] = e
+    return embs
+
 
-        if kind == "def":
-            # python-style def
-            pat = re.compile(rf"^\s*def\s+{re.escape(name)}\s*\(", re.M)
-            m = pat.search(content)
-            if m:
-                # capture indented block following the def
-                start_line = content.rfind('\n', 0, m.start()) + 1
-                lines = content[start_line:].splitlines()
-                block_lines = []
-                indent = None
-                for line in lines:
-                    if not block_lines:
-                        block_lines.append(line)
-                        # determine indent of next lines
-                        continue
-                    # stop when we see a top-level line (no indent)
-                    if re.match(r"^\S", line):
-                        break
-                    block_lines.append(line)
-                block = "\n".join(block_lines)
-                matches.append((fp, block))
+def _vector_hits(embeddings, flt: SearchFilter, n: int):
+    """Dense retrieval in flt.root for each query embedding as (id, path, start, end, text, distance), best first.
+
+    All queries go to the root's vector store in a single multi-embedding query, with
+    the filter applied by the store so a filtered search still fills n results.
+    """
+    # only globs and very deep directories need checking here, so fetch some slack for them
+    fetch = n * 3 if flt.residual else n
+    out = []
+    for hits in get_store(flt.root).query(embeddings, fetch, where=flt.where):
+        rows = []
+        for i, d, m, dist in hits:
+            src = m.get("source")
+            if flt and not flt.accept(src):
                 continue
+            rows.append((i, src, m.get("start_line"), m.get("end_line"), d, dist))
+        out.append(rows[:n])
+    return out
+
+
+def _lexical_hits(query: str, flt: SearchFilter, n: int):
+    """BM25 retrieval in flt.root as (id, path, start, end, score), best first."""
+    return get_lexical_index(flt.root).search(query, k=n, accept=flt.accept if flt else None)
 
-    return matches
 
+def _retrieve(flt: SearchFilter, queries, embeddings, mode: str, n: int):
+    """Dense and BM25 hits for each query within one root; one fan-out task."""
+    dense = _vector_hits(embeddings, flt, n) if embeddings is not None else None
+    lexical = [_lexical_hits(q, flt, n) for q in queries] if mode in ("lexical", "hybrid") else None
+    return dense, lexical
 
-def search_code(query: str, ext: str = None):
+
+def _fuse(ranked_lists, k: int = 60):
+    """Reciprocal rank fusion: score(d) = sum over lists of 1 / (k + rank)."""
+    scores = {}
+    best = {}
+    for hits in ranked_lists:
+        for rank, hit in enumerate(hits):
+            scores[hit[0]] = scores.get(hit[0], 0.0) + 1.0 / (k + rank + 1)
+            # prefer the entry that carries text and a distance (the vector hit)
+            if hit[0] not in best or best[hit[0]][4] is None:
+                best[hit[0]] = hit
+    return [best[i] for i in sorted(scores, key=lambda i: -scores[i])]
+
+
+def search_code(query: str, ext: str = None, mode: str = None, path: str = None, root=None):
     """Search the vector DB for relevant code snippets.
 
     If the query looks like a code symbol search (e.g. 'struct Node', 'class Foo', 'def bar')
-    we attempt a fast filesystem scan to return the exact definition. Otherwise we fall back
-    to embedding-based retrieval.
+    the exact definition is returned from the symbol table. Otherwise chunks are retrieved
+    according to mode (default SEARCH_MODE):
+
+      - 'vector':  embedding similarity only
+      - 'lexical': BM25 over identifiers and words only (never loads the embedding model)
+      - 'hybrid':  both lists merged with reciprocal rank fusion
+
+    ext restricts results to one extension and path to a directory or glob under
+    each root ('net/http', 'net/**/*.rs', '*_test.py'); both are applied inside the
+    store query rather than by dropping results afterwards. root names the workspace
+    roots to search ("api,web" or a list; default all). The query is embedded once
+    and every root is searched concurrently, with hits merged by distance.
 
-    Returns a list of tuples: (source_path, snippet_text, distance)
+    Results are memoized per (query, filters, roots, mode, TOP_K, index generation), so repeated
+    queries are free until the indexer writes again.
+
+    Returns a list of tuples: (location, snippet_text, distance) where location is
+    'path:start-end' when the chunk's line span is known.
     """
     if not query:
         return []
+    return search_code_many([query], ext=ext, mode=mode, path=path, root=root)[0]
+
+
+def search_code_many(queries, ext: str = None, mode: str = None, path: str = None, root=None):
+    """search_code for a list of queries, returning one result list per query.
+
+    Cached queries are answered from the result cache; the remaining ones are
+    embedded in one batch and sent to each root's vector store as one query.
+    Raises ValueError for an unknown root name.
+    """
+    roots = select_roots(root)
+    flts = [SearchFilter(ext=ext, path=path, root=r) for r in roots]
+    mode = mode or SEARCH_MODE
+    keys = [(normalize_query(q), flts[0].key(), tuple(roots), mode, TOP_K, generation()) for q in queries]
+    out = [[] if not q else result_cache.get(key) for q, key in zip(queries, keys)]
+    todo = [i for i, r in enumerate(out) if r is None]
+    if todo:
+        for i, res in zip(todo, _search([queries[i] for i in todo], flts, mode)):
+            result_cache.put(keys[i], res)
+            out[i] = res
+    return [list(r) for r in out]
 
+
+def _symbol_hits(query: str, flt: SearchFilter):
+    """Definitions in flt.root for symbol-shaped queries ('struct Node', 'def bar('), else None."""
     # allow queries like 'in .cpp struct Node' or 'in cpp struct Node'
     q = query.strip()
     # strip leading 'in' tokens
@@ -150,45 +208,49 @@ def search_code(query: str, ext: str = None):
     parsed = _parse_code_query(q)
     if parsed:
         kind, name = parsed
-        # try filesystem search first when a language ext is provided or when we can find the symbol
-        fs_matches = _search_files_for_symbol(kind, name, ext=ext)
-        if fs_matches:
-            return [(p, s, None) for p, s in fs_matches]
-
-    # fallback to embedding-based similarity search
-    embedder = get_embedder()
-    collection = get_collection()
-
-    q_emb = embedder.encode([query])[0]
-
-    results = collection.query(
-        query_embeddings=[q_emb],
-        n_results=TOP_K,
-        include=["documents", "metadatas", "distances"],
-    )
-
-    docs_list = results.get("documents", [])
-    metas_list = results.get("metadatas", [])
-    dists_list = results.get("distances", [])
+        # exact definitions come straight from the symbol table built at index time
+        hits = [h for h in get_symbol_index(flt.root).lookup(name, kind=kind, ext=flt.ext) if flt.accept(h[2])]
+        if hits:
+            return [(format_location(p, s, e), _read_span(p, s, e), None) for _, _, p, s, e in hits]
+    return None
 
-    if not docs_list:
-        return []
 
-    docs = docs_list[0]
-    metas = metas_list[0] if metas_list else [{}] * len(docs)
-    dists = dists_list[0] if dists_list else [None] * len(docs)
+def _search(queries, flts, mode: str):
+    """Search every root of flts (one filter per root) for each query.
 
+    Symbol lookups run first; the remaining queries are embedded once and then
+    retrieved from all roots concurrently, so latency follows the slowest root.
+    Dense hits are merged by distance and BM25 hits by score before fusion.
+    """
     out = []
-    for m, d, dist in zip(metas, docs, dists):
-        src = m.get("source") if isinstance(m, dict) else None
-        snippet = _snippet_for_query(d, query)
-        out.append((src, snippet, dist))
-
-    # if extension filter is provided, only return results with matching source paths.
-    if ext:
-        if not ext.startswith('.'):
-            ext = '.' + ext
-        ext = ext.lower()
-        out = [t for t in out if t[0] and t[0].lower().endswith(ext)]
+    for hits in zip(*_fan_out(lambda f: [_symbol_hits(q, f) for q in queries], flts)):
+        found = [h for h in hits if h is not None]
+        out.append([h for hs in found for h in hs] if found else None)
+    todo = [i for i, r in enumerate(out) if r is None]
+    if not todo:
+        return out
+    n = TOP_K if mode != "hybrid" else TOP_K * 3
+
+    pending = [queries[i] for i in todo]
+    embeddings = embed_queries(pending) if mode in ("vector", "hybrid") else None
+    per_root = _fan_out(lambda f: _retrieve(f, pending, embeddings, mode, n), flts)
+    for j, i in enumerate(todo):
+        query = queries[i]
+        ranked = []
+        if embeddings is not None:
+            ranked.append(_merge([dense[j] for dense, _ in per_root], n, key=lambda h: h[5]))
+        if mode in ("lexical", "hybrid"):
+            merged = _merge([lexical[j] for _, lexical in per_root], n, key=lambda h: -h[4])
+            # no text (read from the file below) and no distance
+            ranked.append([(cid, p, s, e, None, None) for cid, p, s, e, _ in merged])
+        hits = ranked[0] if len(ranked) == 1 else _fuse(ranked)
 
+        res = []
+        for _, src, start, end, doc, dist in hits[:TOP_K]:
+            if doc is None:
+                # lexical-only hit: the text comes from the file, not the vector store
+                doc = _read_span(src, start, end)
+            snippet = _snippet_for_query(doc, query)
+            res.append((format_location(src, start, end), snippet, dist))
+        out[i] = res
     return out
@@ -0,0 +1,500 @@
+# Vector store backends (Chroma, FAISS) behind one interface
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import numpy as np
+from config import (
+    CODE_DIR, VECTOR_BACKEND, FAISS_INDEX, FAISS_HNSW_MIN, FAISS_IVFPQ_MIN, FAISS_HNSW_M,
+    FAISS_EF_SEARCH, FAISS_NPROBE, COMPACT_VECTORS, COMPACT_DIM, COMPACT_RERANK, get_collection, get_index_dir, reset_collection,
+)
+from typing import Dict, List, Optional, Tuple
+
+# (id, document, metadata, distance); smaller distance is better
+Hit = Tuple[str, str, dict, float]
+
+# filtered FAISS queries matching at most this many chunks are answered by an exact scan
+_EXACT_FILTER_MAX = 20_000
+
+
+class VectorStore:
+    """What the indexer and search need from a vector database."""
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[dict]):
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def query(self, embeddings, n: int, where: dict = None) -> List[List[Hit]]:
+        """Top-n hits for each query embedding among chunks whose metadata matches where.
+
+        where uses Chroma's filter syntax (see filters.SearchFilter.where); backends
+        apply it inside the search so a filtered query still returns n hits.
+        """
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def reset(self):
+        """Drop everything (e.g. when the embedding model changed)."""
+        raise NotImplementedError
+
+    def persist(self):
+        """Make writes durable; called once at the end of an indexing run."""
+
+    def evaluate(self, k: int = 10, queries: int = 200) -> dict:
+        """Recall@k and memory of the index against exact float32 search."""
+        raise NotImplementedError(f"{type(self).__name__} does not support evaluation")
+
+
+class ChromaStore(VectorStore):
+    """A code root's Chroma collection from config.get_collection."""
+
+    def __init__(self, name: str = "codebase", code_dir: str = CODE_DIR):
+        self.name = name
+        self.code_dir = code_dir
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        get_collection(self.name, self.code_dir).upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids):
+        get_collection(self.name, self.code_dir).delete(ids=ids)
+
+    def count(self):
+        return get_collection(self.name, self.code_dir).count()
+
+    def reset(self):
+        reset_collection(self.name, self.code_dir)
+
+    def query(self, embeddings, n, where=None):
+        collection = get_collection(self.name, self.code_dir)
+        n = min(n, collection.count())
+        if n <= 0:
+            return [[] for _ in embeddings]
+        results = collection.query(
+            query_embeddings=[list(map(float, e)) for e in embeddings],
+            n_results=n,
+            where=where or None,
+            include=["documents", "metadatas", "distances"],
+        )
+        out = []
+        for i, ids in enumerate(results.get("ids") or []):
+            docs = (results.get("documents") or [[]])[i]
+            metas = (results.get("metadatas") or [[{}] * len(ids)])[i]
+            dists = (results.get("distances") or [[None] * len(ids)])[i]
+            out.append([(cid, d, m if isinstance(m, dict) else {}, dist) for cid, d, m, dist in zip(ids, docs, metas, dists)])
+        return out
+
+
+def _where_sql(where: dict) -> Tuple[str, list]:
+    """Chroma-style metadata filter ($and/$or, equality, $eq/$ne/$in) as SQL over the sidecar JSON."""
+    clauses, args = [], []
+    for key, cond in where.items():
+        if key in ("$and", "$or"):
+            parts = [_where_sql(w) for w in cond]
+            clauses.append("(" + f" {key[1:].upper()} ".join(c for c, _ in parts) + ")")
+            for _, a in parts:
+                args.extend(a)
+            continue
+        if not re.fullmatch(r"\w+", key):
+            raise ValueError(f"invalid metadata key: {key!r}")
+        col = f"json_extract(metadata, '$.{key}')"
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, value in cond.items():
+            if op == "$eq":
+                clauses.append(f"{col} = ?")
+                args.append(value)
+            elif op == "$ne":
+                clauses.append(f"({col} IS NULL OR {col} != ?)")
+                args.append(value)
+            elif op == "$in":
+                clauses.append(f"{col} IN ({','.join('?' * len(value))})")
+                args.extend(value)
+            else:
+                raise ValueError(f"unsupported filter operator: {op}")
+    return " AND ".join(clauses) or "1", args
+
+
+def _normalize(vecs) -> np.ndarray:
+    vecs = np.asarray(vecs, dtype=np.float32)
+    if vecs.ndim == 1:
+        vecs = vecs[None, :]
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vecs / norms
+
+
+class FaissStore(VectorStore):
+    """FAISS index (cosine / inner product) with a SQLite sidecar for ids, text and metadata.
+
+    The index type follows corpus size unless FAISS_INDEX pins it: exact "flat"
+    below FAISS_HNSW_MIN vectors, "hnsw" below FAISS_IVFPQ_MIN, then "ivfpq".
+    The sidecar keeps a float16 copy of every vector so the index can be rebuilt
+    (type switch, retraining, tombstone cleanup) without re-embedding. Saved
+    indexes are opened with mmap so startup does not read them into memory;
+    they are loaded fully only when the first write arrives.
+
+    With COMPACT_VECTORS the index holds PCA-projected (COMPACT_DIM) int8 codes
+    with per-dimension ranges; a few times k candidates are then re-ranked
+    exactly against the float16 vectors in the sidecar.
+    """
+
+    def __init__(self, path: str):
+        import faiss
+
+        self.faiss = faiss
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.index_file = os.path.join(path, "index.faiss")
+        self.pca_file = os.path.join(path, "pca.npz")
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(os.path.join(path, "meta.db"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (key INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE, document TEXT, metadata TEXT, vec BLOB, live INTEGER DEFAULT 1)"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS info (k TEXT PRIMARY KEY, v TEXT)")
+        self.db.commit()
+        self.index = None
+        self.kind = self._info("kind")
+        self.mmapped = False
+        self.dirty = False
+        self.pca = None
+        if self._info("compact") == "1" and os.path.exists(self.pca_file):
+            with np.load(self.pca_file) as f:
+                self.pca = (f["mean"], f["components"])
+        if self.kind and os.path.exists(self.index_file):
+            self._open_index(mmap=True)
+            if (self.pca is not None) != self._compact_for(self.count()):
+                # COMPACT_VECTORS was toggled: re-encode from the sidecar, no re-embedding needed
+                self.persist()
+
+    def _info(self, key: str) -> Optional[str]:
+        row = self.db.execute("SELECT v FROM info WHERE k = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_info(self, key: str, value):
+        self.db.execute("INSERT OR REPLACE INTO info VALUES (?, ?)", (key, str(value)))
+
+    def _open_index(self, mmap: bool):
+        faiss = self.faiss
+        self.mmapped = False
+        if mmap:
+            try:
+                self.index = faiss.read_index(self.index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                self.mmapped = True
+            except Exception:
+                self.index = None
+        if self.index is None or not mmap:
+            self.index = faiss.read_index(self.index_file)
+        self._tune()
+
+    def _writable(self):
+        """mmapped indexes are read-only; load the index into memory before modifying it."""
+        if self.mmapped:
+            self._open_index(mmap=False)
+
+    def _tune(self):
+        faiss = self.faiss
+        if self.kind == "hnsw":
+            faiss.downcast_index(faiss.downcast_index(self.index).index).hnsw.efSearch = FAISS_EF_SEARCH
+        elif self.kind == "ivfpq":
+            faiss.extract_index_ivf(self.index).nprobe = FAISS_NPROBE
+
+    def _kind_for(self, n: int) -> str:
+        if FAISS_INDEX == "ivfpq" and n < 10_000:
+            # too few vectors to train the quantizers; persist() switches once there are enough
+            return "flat"
+        if FAISS_INDEX != "auto":
+            return FAISS_INDEX
+        if n >= FAISS_IVFPQ_MIN:
+            return "ivfpq"
+        if n >= FAISS_HNSW_MIN:
+            return "hnsw"
+        return "flat"
+
+    def _compact_for(self, n: int) -> bool:
+        # PCA needs clearly more samples than output dimensions
+        return COMPACT_VECTORS and n >= 4 * COMPACT_DIM
+
+    def _project(self, vecs: np.ndarray) -> np.ndarray:
+        if self.pca is None:
+            return vecs
+        mean, components = self.pca
+        return _normalize((vecs - mean) @ components.T)
+
+    def _fit_pca(self, n: int):
+        from sklearn.decomposition import PCA
+
+        step = max(1, n // 100_000)
+        sample = np.concatenate([v[::step] for _, v in self._iter_vectors()])
+        pca = PCA(n_components=min(COMPACT_DIM, sample.shape[1])).fit(sample)
+        self.pca = (pca.mean_.astype(np.float32), pca.components_.astype(np.float32))
+        np.savez(self.pca_file, mean=self.pca[0], components=self.pca[1])
+
+    def _new_index(self, kind: str, dim: int, n: int):
+        faiss = self.faiss
+        codes = "_SQ8" if self.pca is not None else ""
+        if kind == "hnsw":
+            return faiss.index_factory(dim, f"IDMap2,HNSW{FAISS_HNSW_M}{codes}", faiss.METRIC_INNER_PRODUCT)
+        if kind == "ivfpq":
+            nlist = max(1, int(4 * math.sqrt(n)))
+            # PQ sub-quantizers must divide the dimension; at least 8 dims per sub-vector
+            m = max(d for d in range(1, dim // 8 + 1) if dim % d == 0) if dim >= 8 else 1
+            return faiss.index_factory(dim, f"IVF{nlist},PQ{m}", faiss.METRIC_INNER_PRODUCT)
+        return faiss.index_factory(dim, "IDMap2,SQ8" if codes else "IDMap2,Flat", faiss.METRIC_INNER_PRODUCT)
+
+    def _iter_vectors(self, batch: int = 65536, clause: str = "1", args=()):
+        last = 0
+        while True:
+            rows = self.db.execute(
+                f"SELECT key, vec FROM chunks WHERE live = 1 AND key > ? AND ({clause}) ORDER BY key LIMIT ?",
+                (last, *args, batch),
+            ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            keys = np.array([r[0] for r in rows], dtype=np.int64)
+            vecs = np.stack([np.frombuffer(r[1], dtype=np.float16) for r in rows]).astype(np.float32)
+            yield keys, vecs
+
+    def _rebuild(self, kind: str):
+        """Rebuild the index from the sidecar vectors (drops tombstones)."""
+        self.db.execute("DELETE FROM chunks WHERE live = 0")
+        n = self.count()
+        dim = int(self._info("dim") or 0)
+        self.kind = kind
+        self.pca = None
+        if dim and self._compact_for(n):
+            self._fit_pca(n)
+            dim = self.pca[1].shape[0]
+        self.index = self._new_index(kind, dim, n) if dim else None
+        self.mmapped = False
+        if self.index is None:
+            return
+        if not self.index.is_trained:
+            # train on an evenly spaced sample of at most 100k vectors
+            step = max(1, n // 100_000)
+            sample = np.concatenate([v[::step] for _, v in self._iter_vectors()])
+            self.index.train(self._project(sample))
+        for keys, vecs in self._iter_vectors():
+            self.index.add_with_ids(self._project(vecs), keys)
+        self._tune()
+        self._set_info("kind", kind)
+        self._set_info("compact", int(self.pca is not None))
+        self.dirty = True
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        vecs = _normalize(embeddings)
+        with self.lock:
+            self._delete(ids)
+            if self._info("dim") is None:
+                self._set_info("dim", vecs.shape[1])
+            keys = []
+            for cid, doc, meta, vec in zip(ids, documents, metadatas, vecs):
+                cur = self.db.execute(
+                    "INSERT INTO chunks (id, document, metadata, vec) VALUES (?, ?, ?, ?)",
+                    (cid, doc, json.dumps(meta), vec.astype(np.float16).tobytes()),
+                )
+                keys.append(cur.lastrowid)
+            if self.index is None:
+                self._rebuild(self._kind_for(self.count()))
+            else:
+                self._writable()
+                self.index.add_with_ids(self._project(vecs), np.array(keys, dtype=np.int64))
+            self.dirty = True
+
+    def _delete(self, ids):
+        if not ids:
+            return
+        rows = []
+        for i in range(0, len(ids), 500):
+            part = list(ids[i:i + 500])
+            rows += self.db.execute(
+                f"SELECT key FROM chunks WHERE live = 1 AND id IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+        keys = [r[0] for r in rows]
+        if not keys:
+            return
+        qmarks = ",".join("?" * len(keys))
+        if self.index is not None and self.kind != "hnsw":
+            self._writable()
+            self.index.remove_ids(np.array(keys, dtype=np.int64))
+            self.db.execute(f"DELETE FROM chunks WHERE key IN ({qmarks})", keys)
+        else:
+            # HNSW cannot remove vectors: tombstone them until the next rebuild
+            self.db.execute(f"UPDATE chunks SET live = 0, id = NULL WHERE key IN ({qmarks})", keys)
+        self.dirty = True
+
+    def delete(self, ids):
+        with self.lock:
+            self._delete(list(ids))
+
+    def count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM chunks WHERE live = 1").fetchone()[0]
+
+    def _tombstones(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM chunks WHERE live = 0").fetchone()[0]
+
+    def reset(self):
+        with self.lock:
+            self.db.execute("DELETE FROM chunks")
+            self.db.execute("DELETE FROM info")
+            self.db.commit()
+            self.index, self.kind, self.mmapped, self.pca = None, None, False, None
+            for path in (self.index_file, self.pca_file):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def persist(self):
+        with self.lock:
+            n = self.count()
+            kind = self._kind_for(n)
+            layout_changed = kind != self.kind or (self.pca is not None) != self._compact_for(n)
+            if self.index is not None and (layout_changed or self._tombstones() > 0.2 * max(n, 1)):
+                self._rebuild(kind)
+            if self.dirty and self.index is not None:
+                tmp = self.index_file + ".tmp"
+                self.faiss.write_index(self.index, tmp)
+                os.replace(tmp, self.index_file)
+            self.db.commit()
+            self.dirty = False
+
+    def _resolve(self, q: np.ndarray, scores, keys, n: int, rerank: bool) -> List[List[Hit]]:
+        """Turn per-query (scores, keys) from a search into hits, skipping tombstones."""
+        out = []
+        for qv, row_scores, row_keys in zip(q, scores, keys):
+            wanted = [int(key) for key in row_keys if key >= 0]
+            rows = {}
+            if wanted:
+                rows = {
+                    r[0]: r[1:] for r in self.db.execute(
+                        f"SELECT key, id, document, metadata, vec FROM chunks WHERE live = 1 AND key IN ({','.join('?' * len(wanted))})",
+                        wanted,
+                    )
+                }
+            hits = []
+            for score, key in zip(row_scores, row_keys):
+                row = rows.get(int(key))
+                if row is None:
+                    continue
+                if rerank:
+                    # exact cosine against the stored original
+                    score = float(np.frombuffer(row[3], dtype=np.float16).astype(np.float32) @ qv)
+                hits.append((row[0], row[1], json.loads(row[2]), float(1.0 - score)))
+                if not rerank and len(hits) >= n:
+                    break
+            if rerank:
+                hits.sort(key=lambda h: h[3])
+            out.append(hits[:n])
+        return out
+
+    def _search(self, q: np.ndarray, n: int, rerank: bool, allowed: np.ndarray = None) -> List[List[Hit]]:
+        if self.index is None or self.index.ntotal == 0:
+            return [[] for _ in range(len(q))]
+        fetch = n * COMPACT_RERANK if rerank else n
+        params = None
+        if allowed is not None:
+            # the selector only admits live keys, so tombstones need no over-fetch
+            k = min(len(allowed), fetch)
+            sel = self.faiss.IDSelectorBatch(allowed)
+            if self.kind == "ivfpq":
+                params = self.faiss.SearchParametersIVF(sel=sel, nprobe=FAISS_NPROBE)
+            else:
+                params = self.faiss.SearchParameters(sel=sel)
+        else:
+            # over-fetch past tombstoned vectors still present in an HNSW graph
+            k = min(self.index.ntotal, fetch + min(self._tombstones(), 10 * n))
+        scores, keys = self.index.search(self._project(q), k, params=params)
+        return self._resolve(q, scores, keys, n, rerank)
+
+    def query(self, embeddings, n, where=None):
+        q = _normalize(embeddings)
+        with self.lock:
+            # compressed codes only approximate the score, so re-rank a wider candidate set
+            rerank = self.pca is not None or self.kind == "ivfpq"
+            if not where:
+                return self._search(q, n, rerank)
+            clause, args = _where_sql(where)
+            allowed = np.array(
+                [r[0] for r in self.db.execute(f"SELECT key FROM chunks WHERE live = 1 AND ({clause})", args)],
+                dtype=np.int64,
+            )
+            if not len(allowed):
+                return [[] for _ in range(len(q))]
+            if len(allowed) <= _EXACT_FILTER_MAX:
+                # a small subset is scanned exactly from the sidecar, cheaper than a filtered ANN search
+                scores, keys = zip(*self._top_keys(q, n, clause, args))
+                return self._resolve(q, scores, keys, n, rerank=False)
+            return self._search(q, n, rerank, allowed)
+
+    def _top_keys(self, q: np.ndarray, k: int, clause: str = "1", args=()):
+        """Brute-force top-k (scores, keys) per query over the float16 sidecar vectors."""
+        best = [(np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)) for _ in range(len(q))]
+        for keys, vecs in self._iter_vectors(clause=clause, args=args):
+            scores = q @ vecs.T
+            for i in range(len(q)):
+                s = np.concatenate([best[i][0], scores[i]])
+                ks = np.concatenate([best[i][1], keys])
+                top = np.argsort(-s)[:k]
+                best[i] = (s[top], ks[top])
+        return best
+
+    def _exact(self, q: np.ndarray, k: int) -> List[List[str]]:
+        """Ids of the exact top-k per query."""
+        out = []
+        for _, ks in self._top_keys(q, k):
+            ids = dict(self.db.execute(
+                f"SELECT key, id FROM chunks WHERE key IN ({','.join('?' * len(ks))})", [int(x) for x in ks]
+            ).fetchall())
+            out.append([ids[int(x)] for x in ks])
+        return out
+
+    def evaluate(self, k: int = 10, queries: int = 200) -> dict:
+        """Recall@k (with and without re-rank) and index size against exact float32 search.
+
+        Queries are stored vectors sampled evenly across the corpus.
+        """
+        with self.lock:
+            n = self.count()
+            if self.index is None or not n:
+                return {}
+            step = max(1, n // queries)
+            q = np.concatenate([v[::step] for _, v in self._iter_vectors(batch=step * 1024)])[:queries]
+            q = _normalize(q)
+            exact = self._exact(q, k)
+
+            def recall(results):
+                return sum(len(set(e) & {h[0] for h in r}) for e, r in zip(exact, results)) / (len(q) * k)
+
+            dim = int(self._info("dim"))
+            return {
+                "vectors": n,
+                "kind": self.kind,
+                "compact": self.pca is not None,
+                "recall": recall(self._search(q, k, rerank=True)),
+                "recall_no_rerank": recall(self._search(q, k, rerank=False)),
+                "index_bytes": int(self.faiss.serialize_index(self.index).nbytes),
+                "baseline_bytes": n * dim * 4,
+            }
+
+
+_stores: Dict[str, VectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(code_dir: str = CODE_DIR) -> VectorStore:
+    """Return the configured vector store (VECTOR_BACKEND) for a code root."""
+    with _stores_lock:
+        key = f"{VECTOR_BACKEND}:{os.path.abspath(code_dir)}"
+        if key not in _stores:
+            if VECTOR_BACKEND == "faiss":
+                _stores[key] = FaissStore(os.path.join(get_index_dir(code_dir), "faiss"))
+            else:
+                _stores[key] = ChromaStore(code_dir=code_dir)
+        return _stores[key]
@@ -0,0 +1,234 @@
+# Persistent symbol table (name -> kind, path, line span) built during indexing
+import ast
+import difflib
+import os
+import re
+import sqlite3
+import threading
+from chunker import BRACE_EXTS, brace_depths
+from config import CODE_DIR, get_index_dir
+from typing import Dict, List, Optional, Tuple
+
+SYMBOLS_VERSION = 1
+SYMBOLS_FILE = "symbols.db"
+
+# (name, kind, path, start_line, end_line), lines are 1-based and inclusive
+Symbol = Tuple[str, str, str, int, int]
+
+# query keyword -> stored kinds it should match
+KIND_GROUPS = {
+    "class": ("class", "interface", "trait", "enum"),
+    "struct": ("struct", "union"),
+    "def": ("def", "function", "fn"),
+    "function": ("def", "function", "fn"),
+}
+
+_TYPE_RE = re.compile(r"\b(struct|class|union|enum|interface|trait)\s+(?:class\s+|struct\s+)?([A-Za-z_]\w*)")
+_RUST_FN_RE = re.compile(r"\bfn\s+([A-Za-z_]\w*)")
+_JS_FN_RE = re.compile(r"\bfunction\s*\*?\s*([A-Za-z_$][\w$]*)\s*\(")
+_JS_ARROW_RE = re.compile(r"\b(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>)")
+_C_FN_RE = re.compile(r"^\s*(?:[\w*&:<>\[\],]+\s+)*[*&]*(~?[A-Za-z_]\w*)\s*\(")
+_PY_DEF_RE = re.compile(r"^(\s*)(?:async\s+)?(def|class)\s+([A-Za-z_]\w*)")
+_NOT_FUNCTIONS = {"if", "for", "while", "switch", "return", "catch", "sizeof", "new", "else", "do", "try", "using", "case", "throw", "delete", "match", "loop"}
+
+
+def _python_symbols(text: str) -> List[Tuple[str, str, int, int]]:
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return _python_symbols_by_indent(text.splitlines())
+    out = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            kind = "class" if isinstance(node, ast.ClassDef) else "def"
+            out.append((node.name, kind, start, node.end_lineno))
+    return out
+
+
+def _python_symbols_by_indent(lines: List[str]):
+    """Fallback for files ast cannot parse: the block ends at the next line indented as deep or less."""
+    out = []
+    for i, line in enumerate(lines):
+        m = _PY_DEF_RE.match(line)
+        if not m:
+            continue
+        indent = len(m.group(1))
+        end = i
+        for j in range(i + 1, len(lines)):
+            stripped = lines[j].strip()
+            if stripped and len(lines[j]) - len(lines[j].lstrip()) <= indent:
+                break
+            if stripped:
+                end = j
+        out.append((m.group(3), m.group(2), i + 1, end + 1))
+    return out
+
+
+def _block_end(lines: List[str], depths: List[int], i: int) -> Optional[int]:
+    """Last line of the brace block opened at or shortly after line i; None for declarations."""
+    base = depths[i - 1] if i > 0 else 0
+    for j in range(i, min(len(lines), i + 4)):
+        code = lines[j].split("//", 1)[0]
+        if "{" in code:
+            break
+        if ";" in code:
+            return None
+    else:
+        return None
+    for j in range(i, len(lines)):
+        if depths[j] <= base and "}" in lines[j]:
+            return j
+    return len(lines) - 1
+
+
+def _brace_symbols(lines: List[str]) -> List[Tuple[str, str, int, int]]:
+    depths = brace_depths(lines)
+    out = []
+    for i, line in enumerate(lines):
+        stripped = line.lstrip()
+        if not stripped or stripped.startswith(("//", "/*", "*", "#")):
+            continue
+        found = None
+        m = _TYPE_RE.search(line)
+        if m:
+            found = (m.group(2), m.group(1))
+        else:
+            for rx, kind in ((_RUST_FN_RE, "fn"), (_JS_FN_RE, "function"), (_JS_ARROW_RE, "function")):
+                m = rx.search(line)
+                if m:
+                    found = (m.group(1), kind)
+                    break
+            else:
+                m = _C_FN_RE.match(line)
+                if m and m.group(1) not in _NOT_FUNCTIONS and not stripped.rstrip().endswith(";"):
+                    found = (m.group(1), "function")
+        if not found:
+            continue
+        end = _block_end(lines, depths, i)
+        if end is None:
+            # forward declaration / prototype
+            continue
+        out.append((found[0], found[1], i + 1, end + 1))
+    return out
+
+
+def extract_symbols(path: str, text: str) -> List[Tuple[str, str, int, int]]:
+    """Definitions in one file as (name, kind, start_line, end_line)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".py", ".pyi"):
+        return _python_symbols(text)
+    if ext in BRACE_EXTS:
+        return _brace_symbols(text.splitlines())
+    return []
+
+
+class SymbolIndex:
+    """SQLite-backed symbol table kept next to the vector store.
+
+    Plugs into the indexer as a side index: `extract` runs on the reader pool,
+    `update`/`remove` apply per-file changes, `commit` makes them durable.
+    """
+
+    name = "symbols"
+    version = SYMBOLS_VERSION
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS symbols (name TEXT, lname TEXT, kind TEXT, path TEXT, start_line INTEGER, end_line INTEGER)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS symbols_name ON symbols(name)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS symbols_lname ON symbols(lname)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS symbols_path ON symbols(path)")
+        self.db.commit()
+        self._names: Optional[List[str]] = None
+
+    # side-index protocol
+
+    def extract(self, path: str, text: str, chunks):
+        return extract_symbols(path, text)
+
+    def update(self, path: str, symbols, ids=None):
+        with self.lock:
+            self.db.execute("DELETE FROM symbols WHERE path = ?", (path,))
+            self.db.executemany(
+                "INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?)",
+                [(n, n.lower(), k, path, s, e) for n, k, s, e in symbols],
+            )
+            self._names = None
+
+    def remove(self, path: str):
+        with self.lock:
+            self.db.execute("DELETE FROM symbols WHERE path = ?", (path,))
+            self._names = None
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM symbols")
+            self._names = None
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+
+    # lookups
+
+    def _query(self, where: str, args, kind: str = None, ext: str = None, limit: int = 50) -> List[Symbol]:
+        sql = f"SELECT name, kind, path, start_line, end_line FROM symbols WHERE {where}"
+        args = list(args)
+        if kind:
+            kinds = KIND_GROUPS.get(kind, (kind,))
+            sql += f" AND kind IN ({','.join('?' * len(kinds))})"
+            args.extend(kinds)
+        if ext:
+            sql += " AND path LIKE ?"
+            args.append("%" + ext)
+        sql += " ORDER BY length(name), path, start_line LIMIT ?"
+        args.append(limit)
+        with self.lock:
+            return [tuple(r) for r in self.db.execute(sql, args)]
+
+    def lookup(self, name: str, kind: str = None, ext: str = None, limit: int = 50) -> List[Symbol]:
+        """Exact (case-sensitive) definitions of name."""
+        return self._query("name = ?", (name,), kind, ext, limit)
+
+    def prefix(self, prefix: str, kind: str = None, ext: str = None, limit: int = 50) -> List[Symbol]:
+        """Case-insensitive prefix match, served by the lname index."""
+        lo = prefix.lower()
+        return self._query("lname >= ? AND lname < ?", (lo, lo + "\U0010ffff"), kind, ext, limit)
+
+    def fuzzy(self, name: str, kind: str = None, ext: str = None, limit: int = 20, cutoff: float = 0.7) -> List[Symbol]:
+        """Closest names by difflib ratio (typos, wrong case)."""
+        with self.lock:
+            if self._names is None:
+                self._names = [r[0] for r in self.db.execute("SELECT DISTINCT name FROM symbols")]
+            names = self._names
+        out = []
+        for n in difflib.get_close_matches(name, names, n=limit, cutoff=cutoff):
+            out.extend(self._query("name = ?", (n,), kind, ext, limit))
+            if len(out) >= limit:
+                break
+        return out[:limit]
+
+    def find(self, name: str, kind: str = None, ext: str = None, limit: int = 50) -> List[Symbol]:
+        """Exact match, then prefix, then fuzzy; a trailing '*' asks for prefix matches only."""
+        if name.endswith("*"):
+            return self.prefix(name[:-1], kind, ext, limit)
+        return self.lookup(name, kind, ext, limit) or self.prefix(name, kind, ext, limit) or self.fuzzy(name, kind, ext, limit)
+
+
+_indexes: Dict[str, SymbolIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_symbol_index(code_dir: str = CODE_DIR) -> SymbolIndex:
+    """Return the symbol index stored in the code root's index dir."""
+    path = os.path.join(get_index_dir(code_dir), SYMBOLS_FILE)
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = SymbolIndex(path)
+        return _indexes[path]
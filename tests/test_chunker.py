@@ -0,0 +1,34 @@
+# Python chunking: oversized classes split per member, wherever they sit in the module
+from chunker import chunk_file
+
+
+def _module(tail: str) -> str:
+    methods = "".join(
+        f"    def method_{i}(self, value):\n"
+        f"        total = value * {i} + self.offset\n"
+        f"        return total - {i}\n\n"
+        for i in range(6)
+    )
+    return "import os\n\n\nclass Big:\n    offset = 1\n\n" + methods + tail
+
+
+def _chunks(text: str):
+    return chunk_file("m.py", text, max_tokens=60, overlap=0)
+
+
+def _whole_members(chunks) -> bool:
+    # a chunk cut from line windows ends or starts in the middle of a method
+    return all(text.count("def ") == text.count("return ") for text, _, _ in chunks)
+
+
+def test_final_class_splits_per_member():
+    chunks = _chunks(_module(""))
+    assert len(chunks) > 2
+    assert _whole_members(chunks)
+
+
+def test_final_class_with_trailing_lines_splits_the_same():
+    # the last unit runs to EOF, past the class's own end line
+    chunks = _chunks(_module("\n# end of module\n\n"))
+    assert _whole_members(chunks)
+    assert [s for _, s, _ in chunks] == [s for _, s, _ in _chunks(_module(""))]
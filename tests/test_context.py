@@ -0,0 +1,28 @@
+# Packing retrieved spans into the question's token budget
+from context import build_context
+
+
+def _hit(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return (f"{path}:1-{text.count(chr(10))}", text, 0.1)
+
+
+def test_block_is_cut_to_its_leading_lines(tmp_path):
+    text = "".join(f"value_{i} = compute({i})\n" for i in range(200))
+    context, report = build_context([_hit(tmp_path, "a.py", text)], budget=100)
+    header, *body = context.splitlines()
+    assert header.endswith(f"a.py:1-{len(body) - 1}")
+    assert body[-1] == "..."
+    assert report["truncated"] == 1
+
+
+def test_block_whose_first_line_does_not_fit_is_skipped(tmp_path):
+    small = _hit(tmp_path, "a.py", "x = 1\n")
+    # one long line: nothing of it fits into what is left of the budget
+    long = _hit(tmp_path, "b.py", " ".join(f"item_{i}" for i in range(2000)) + "\n")
+    context, report = build_context([small, long], budget=300)
+    assert "b.py" not in context
+    assert report["skipped"] == 1
+    assert report["truncated"] == 0
+    assert report["blocks"] == 1
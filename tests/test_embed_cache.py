@@ -0,0 +1,36 @@
+# On-disk embedding cache: digests round-trip exactly, across reopening
+import numpy as np
+
+from embed_cache import EmbeddingCache, text_key
+
+# a digest ending in NUL bytes, which a bytes ("S20") dtype would strip
+NUL_KEY = b"\x07" * 18 + b"\0\0"
+
+
+def test_digest_with_trailing_nuls_hits(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 1024)
+    vecs = np.arange(8, dtype=np.float32).reshape(2, 4)
+    cache.put_many([NUL_KEY, text_key("x = 1")], vecs)
+    got = cache.get_many([NUL_KEY, text_key("x = 1"), text_key("other")])
+    assert np.array_equal(got[0], vecs[0])
+    assert np.array_equal(got[1], vecs[1])
+    assert got[2] is None
+
+
+def test_entries_survive_reopening(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 1024)
+    vec = np.ones((1, 4), dtype=np.float32)
+    cache.put_many([NUL_KEY], vec)
+    cache.flush()
+    reopened = EmbeddingCache(str(tmp_path), 1024)
+    assert np.array_equal(reopened.get_many([NUL_KEY])[0], vec[0])
+
+
+def test_evicted_slot_is_a_miss(tmp_path):
+    # room for two 4-dim vectors
+    cache = EmbeddingCache(str(tmp_path), 32)
+    keys = [NUL_KEY, text_key("a"), text_key("b")]
+    cache.put_many(keys, np.eye(3, 4, dtype=np.float32))
+    got = cache.get_many(keys)
+    assert got[0] is None
+    assert np.array_equal(got[2], np.eye(3, 4, dtype=np.float32)[2])
@@ -0,0 +1,31 @@
+# Manifest: a file written while it is being indexed is picked up again
+import os
+
+from manifest import Manifest, content_digest, file_stat
+
+
+def test_write_during_indexing_leaves_the_file_stale(tmp_path):
+    fp = str(tmp_path / "a.py")
+    with open(fp, "w") as f:
+        f.write("x = 1\n")
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    # the indexer stats, then reads; an edit lands before the manifest is updated
+    st = file_stat(fp)
+    digest = content_digest(open(fp).read())
+    with open(fp, "w") as f:
+        f.write("x = 2  # edited\n")
+    manifest.update(fp, digest, ["a.py:0:abc"], st)
+    assert manifest.diff([fp]) == ([fp], [])
+
+
+def test_unchanged_file_is_not_stale(tmp_path):
+    fp = str(tmp_path / "a.py")
+    with open(fp, "w") as f:
+        f.write("x = 1\n")
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    manifest.update(fp, content_digest("x = 1\n"), [], file_stat(fp))
+    manifest.save()
+    loaded = Manifest.load(manifest.path)
+    assert loaded.diff([fp, str(tmp_path / "new.py")]) == ([str(tmp_path / "new.py")], [])
+    os.remove(fp)
+    assert loaded.diff([]) == ([], [fp])
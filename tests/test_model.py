@@ -0,0 +1,156 @@
+# OllamaClient against a local stub of Ollama's streaming /api/generate
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import model
+from model import Cancel, OllamaClient, OllamaError
+
+TOKENS = ["Hello", " world", ",", " streamed", "."]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+        if body["model"] == "missing":
+            data = json.dumps({"error": 'model "missing" not found'}).encode()
+            self.send_response(404)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        slow = body["prompt"] == "slow"
+        try:
+            for token in TOKENS * (50 if slow else 1):
+                self._chunk({"response": token, "done": False})
+                if slow:
+                    time.sleep(0.05)
+            if body["prompt"] != "cut":
+                self._chunk({"response": "", "done": True, "context": [1, 2, 3]})
+            # "cut" ends the body without the final {"done": true}
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.aborted.set()
+
+    def _chunk(self, msg: dict):
+        data = (json.dumps(msg) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    srv.connections = 0
+    srv.requests = []
+    srv.aborted = threading.Event()
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def client(server):
+    return OllamaClient(f"http://127.0.0.1:{server.server_address[1]}", timeout=5)
+
+
+def test_stream_yields_tokens_in_order(client, server):
+    seen = []
+    text, state = client.stream("hi", "m", on_token=seen.append, keep_alive="5m")
+    assert seen == TOKENS
+    assert text == "".join(TOKENS)
+    assert state == [1, 2, 3]
+    assert server.requests[0]["stream"] is True
+    assert server.requests[0]["keep_alive"] == "5m"
+
+
+def test_connection_is_reused_across_requests(client, server):
+    client.stream("one", "m")
+    client.stream("two", "m", context=[1, 2, 3])
+    assert server.connections == 1
+    assert server.requests[1]["context"] == [1, 2, 3]
+
+
+def test_cancel_mid_stream_drops_the_connection(client, server):
+    cancel = Cancel()
+    seen = []
+
+    def on_token(piece):
+        seen.append(piece)
+        if len(seen) == 3:
+            cancel.set()
+
+    text, state = client.stream("slow", "m", on_token=on_token, cancel=cancel)
+    assert text == "".join(TOKENS[:3])
+    assert state is None
+    # closed, not returned to the pool; the server sees the client go away
+    assert client._pool.qsize() == 0
+    assert server.aborted.wait(5)
+    client.stream("after", "m")
+    assert server.connections == 2
+
+
+def test_http_error_status(client):
+    with pytest.raises(OllamaError, match='404.*model "missing" not found'):
+        client.stream("hi", "missing")
+    assert client._pool.qsize() == 0
+
+
+def test_refused_connection():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    # nothing listens on port any more
+    with pytest.raises(OllamaError, match="Cannot reach Ollama"):
+        OllamaClient(f"http://127.0.0.1:{port}", timeout=5).stream("hi", "m")
+
+
+class _Cache:
+    def __init__(self):
+        self.puts = []
+
+    def get(self, key):
+        return None
+
+    def put(self, key, model, query, answer, state):
+        self.puts.append((query, answer, state))
+
+
+@pytest.fixture
+def cache(client, monkeypatch):
+    cache = _Cache()
+    monkeypatch.setattr(model, "get_answer_cache", lambda: cache)
+    monkeypatch.setattr(model, "get_client", lambda: client)
+    monkeypatch.setattr(model, "_prompt", lambda query, context: query)
+    return cache
+
+
+def test_finished_answer_is_cached(cache):
+    assert model.ask_model("hi", "") == "".join(TOKENS)
+    assert cache.puts == [("hi", "".join(TOKENS), [1, 2, 3])]
+
+
+def test_stream_ended_before_done_is_not_cached(client, cache):
+    text, state = client.stream("cut", "m")
+    assert (text, state) == ("".join(TOKENS), None)
+    model.ask_model("cut", "")
+    assert cache.puts == []
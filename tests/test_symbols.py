@@ -0,0 +1,41 @@
+# Symbol table over a C header and a Rust file, fed the way the indexer feeds its side indexes
+import os
+
+from symbols import SymbolIndex
+from utils import get_code_files, read_file
+
+FILES = {
+    "include/node.h": "#pragma once\n\nstruct Node {\n    int value;\n    struct Node *next;\n};\n\nint node_len(struct Node *n);\n",
+    "src/lib.rs": "pub struct Tree {\n    root: Option<Box<u32>>,\n}\n\nimpl Tree {\n    pub fn new() -> Self {\n        Tree { root: None }\n    }\n}\n",
+}
+
+
+def _index(tmp_path):
+    for rel, text in FILES.items():
+        path = tmp_path / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+    index = SymbolIndex(str(tmp_path / "symbols.db"))
+    files = get_code_files(str(tmp_path))
+    for fp in files:
+        index.update(fp, index.extract(fp, read_file(fp), None))
+    index.commit()
+    return index, files
+
+
+def test_headers_and_rust_files_are_indexed(tmp_path):
+    _, files = _index(tmp_path)
+    assert sorted(os.path.relpath(f, tmp_path) for f in files) == sorted(os.path.normpath(p) for p in FILES)
+
+
+def test_struct_in_header(tmp_path):
+    index, _ = _index(tmp_path)
+    hits = index.find("Node", kind="struct")
+    assert [(n, k, os.path.basename(p), s, e) for n, k, p, s, e in hits] == [("Node", "struct", "node.h", 3, 6)]
+
+
+def test_struct_and_fn_in_rust(tmp_path):
+    index, _ = _index(tmp_path)
+    (name, kind, path, start, end), = index.find("Tree", kind="struct")
+    assert (name, kind, os.path.basename(path), start, end) == ("Tree", "struct", "lib.rs", 1, 3)
+    assert [os.path.basename(p) for _, _, p, _, _ in index.find("new", kind="fn")] == ["lib.rs"]
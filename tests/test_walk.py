@@ -0,0 +1,115 @@
+# File discovery: ignore rules around a checkout, and single paths held to the walk's rules
+import asyncio
+import os
+import threading
+
+import pytest
+
+import watcher
+from utils import CodeFileFilter, get_code_files
+from watcher import Watcher
+
+FILES = {
+    "src/a.py": "x = 1\n",
+    "src/gen/b.py": "y = 1\n",
+    "src/app.min.js": "z\n",
+    "src/keep.min.js": "k\n",
+    "src/keep/d.py": "ok\n",
+    "src/generated_big.py": "x = 1\n" * 10,
+    "src/blob.py": "\0\1\2",
+    "build/c.py": "b\n",
+}
+
+
+def _project(tmp_path):
+    # a home directory under git that ignores everything, with the project its own checkout
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".gitignore").write_text("*\n")
+    proj = tmp_path / "proj"
+    for rel, text in FILES.items():
+        path = proj / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+    (proj / ".git").mkdir()
+    (proj / "src" / ".gitignore").write_text("gen/\n*.min.js\n!keep.min.js\ngenerated_big.py\n")
+    return str(proj)
+
+
+def _rel(root, paths):
+    return sorted(os.path.relpath(p, root) for p in paths)
+
+
+WALKED = ["src/a.py", "src/keep.min.js", "src/keep/d.py"]
+
+
+def test_rules_above_the_checkout_are_not_applied(tmp_path):
+    proj = _project(tmp_path)
+    assert _rel(proj, get_code_files(proj)) == WALKED
+
+
+def test_git_file_marks_a_checkout(tmp_path):
+    proj = _project(tmp_path)
+    os.rmdir(os.path.join(proj, ".git"))
+    assert get_code_files(proj) == []
+    # worktrees and submodules have a .git file
+    with open(os.path.join(proj, ".git"), "w") as f:
+        f.write("gitdir: ../.git/worktrees/proj\n")
+    assert _rel(proj, get_code_files(proj)) == WALKED
+
+
+def test_filter_agrees_with_the_walk(tmp_path):
+    proj = _project(tmp_path)
+    accepts = CodeFileFilter(proj)
+    every = [os.path.join(d, n) for d, _, names in os.walk(proj) for n in names]
+    assert _rel(proj, filter(accepts, every)) == WALKED
+
+
+def test_filter_applies_size_cap(tmp_path):
+    proj = _project(tmp_path)
+    assert CodeFileFilter(proj)(os.path.join(proj, "src", "a.py"))
+    assert not CodeFileFilter(proj, max_size=3)(os.path.join(proj, "src", "a.py"))
+
+
+def test_watcher_queues_only_files_the_walk_would_index(tmp_path):
+    proj = _project(tmp_path)
+    w = Watcher(proj)
+    for rel in FILES:
+        w.notify(os.path.join(proj, rel))
+    # a deleted file is still queued so its chunks are removed
+    w.notify(os.path.join(proj, "src", "gone.py"))
+    assert _rel(proj, w.pending) == sorted(WALKED + ["src/gone.py"])
+
+
+def test_new_directories_are_walked_off_the_event_loop(tmp_path, monkeypatch):
+    proj = _project(tmp_path)
+    threads = []
+    walk = watcher.get_code_files
+
+    def get_code_files(path, *args, **kwargs):
+        threads.append(threading.current_thread())
+        return walk(path, *args, **kwargs)
+
+    monkeypatch.setattr(watcher, "get_code_files", get_code_files)
+
+    async def run():
+        w = Watcher(proj)
+        w.start()
+        try:
+            if w.mode != "inotify":
+                pytest.skip("inotify is not available")
+            for d in ("src/new/deep", "src/gen/more", "node_modules/pkg"):
+                os.makedirs(os.path.join(proj, d))
+                with open(os.path.join(proj, d, "m.py"), "w") as f:
+                    f.write("m = 1\n")
+            for _ in range(50):
+                await asyncio.sleep(0.05)
+                if w.pending:
+                    break
+            await asyncio.sleep(0.2)
+            return w.pending
+        finally:
+            w.stop()
+
+    pending = asyncio.run(run())
+    assert _rel(proj, pending) == ["src/new/deep/m.py"]
+    assert threads and threading.main_thread() not in threads
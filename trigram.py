@@ -0,0 +1,290 @@
+# Persistent trigram index for regex search over the indexed files
+import os
+import re
+import sqlite3
+import threading
+import numpy as np
+from config import CODE_DIR, get_index_dir
+from utils import read_file
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import re._parser as _sre_parse
+    import re._constants as _sre
+except ImportError:  # python < 3.11
+    import sre_parse as _sre_parse
+    import sre_constants as _sre
+
+TRIGRAM_VERSION = 1
+TRIGRAM_FILE = "trigram.db"
+# postings buffered in memory before they are written out as a new segment
+FLUSH_POSTINGS = 4_000_000
+# segments are merged (dropping removed files) once there are more than this many
+MAX_SEGMENTS = 12
+
+# (path, line, text)
+GrepHit = Tuple[str, int, str]
+
+
+def trigrams(text: str) -> np.ndarray:
+    """Sorted distinct case-folded byte trigrams of text, packed into uint32."""
+    data = np.frombuffer(text.lower().encode("utf-8", "surrogatepass"), dtype=np.uint8).astype(np.uint32)
+    if len(data) < 3:
+        return np.empty(0, dtype=np.uint32)
+    return np.unique((data[:-2] << 16) | (data[1:-1] << 8) | data[2:])
+
+
+# regex -> trigram query: ("all",) matches every file, ("and", [...]) / ("or", [...])
+# combine sub-queries, ("tri", t) requires trigram t
+_ALL = ("all",)
+
+
+def _and(parts):
+    parts = [p for p in parts if p != _ALL]
+    if not parts:
+        return _ALL
+    return parts[0] if len(parts) == 1 else ("and", parts)
+
+
+def _literal_query(s: str):
+    return _and([("tri", int(t)) for t in trigrams(s)])
+
+
+def _sequence_query(items) -> tuple:
+    """Required trigrams of a parsed regex sequence: literal runs plus required sub-patterns."""
+    parts = []
+    run = []
+
+    def flush():
+        if len(run) >= 3:
+            parts.append(_literal_query("".join(run)))
+        run.clear()
+
+    for op, av in items:
+        if op is _sre.LITERAL:
+            run.append(chr(av))
+        elif op is _sre.AT:
+            # anchors and \b consume no characters, so the literal run continues
+            continue
+        elif op is _sre.SUBPATTERN:
+            flush()
+            parts.append(_sequence_query(av[-1]))
+        elif op is _sre.BRANCH:
+            flush()
+            alts = [_sequence_query(alt) for alt in av[1]]
+            parts.append(_ALL if _ALL in alts else ("or", alts))
+        elif op in (_sre.MAX_REPEAT, _sre.MIN_REPEAT, getattr(_sre, "POSSESSIVE_REPEAT", None)):
+            flush()
+            lo, _, sub = av
+            if lo >= 1:
+                parts.append(_sequence_query(sub))
+        elif op is _sre.IN and len(av) == 1 and av[0][0] is _sre.LITERAL:
+            # a one-character class like [x] is just a literal
+            run.append(chr(av[0][1]))
+        else:
+            flush()
+    flush()
+    return _and(parts)
+
+
+def regex_query(pattern: str, flags: int = 0) -> tuple:
+    """Trigram query that every file matching pattern must satisfy."""
+    return _sequence_query(_sre_parse.parse(pattern, flags))
+
+
+# file ids are stored as int32 arrays; postings dominate the index size
+_ID = np.int32
+
+
+def _decode(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=_ID)
+
+
+class TrigramIndex:
+    """File-level trigram postings in SQLite, kept as a small LSM of segments.
+
+    Each segment stores one sorted array of file ids per trigram. Updates are
+    buffered and written as a new segment on commit, so incremental indexing
+    never rewrites large posting lists; segments are merged once there are more
+    than MAX_SEGMENTS. File ids are never reused, so postings of removed or
+    changed files simply stop resolving to a path until the next merge drops them.
+    Plugs into the indexer as a side index.
+    """
+
+    name = "trigram"
+    version = TRIGRAM_VERSION
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT UNIQUE)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS postings (tri INTEGER, seg INTEGER, files BLOB, PRIMARY KEY (tri, seg)) WITHOUT ROWID"
+        )
+        self.db.commit()
+        self.pending: List[Tuple[int, np.ndarray]] = []
+        self.pending_size = 0
+
+    # side-index protocol
+
+    def extract(self, path: str, text: str, chunks):
+        return trigrams(text)
+
+    def update(self, path: str, tris: np.ndarray, ids=None):
+        with self.lock:
+            self.remove(path)
+            cur = self.db.execute("INSERT INTO files (path) VALUES (?)", (path,))
+            self.pending.append((cur.lastrowid, tris))
+            self.pending_size += len(tris)
+            if self.pending_size >= FLUSH_POSTINGS:
+                self._flush()
+
+    def remove(self, path: str):
+        with self.lock:
+            self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM files")
+            self.db.execute("DELETE FROM postings")
+            self.pending, self.pending_size = [], 0
+
+    def commit(self):
+        with self.lock:
+            self._flush()
+            segments = self.db.execute("SELECT COUNT(DISTINCT seg) FROM postings").fetchone()[0]
+            if segments > MAX_SEGMENTS:
+                self._merge()
+            self.db.commit()
+
+    def _flush(self):
+        """Write buffered postings as a new segment."""
+        if not self.pending:
+            return
+        tris = np.concatenate([t for _, t in self.pending])
+        files = np.concatenate([np.full(len(t), fid, dtype=_ID) for fid, t in self.pending])
+        order = np.lexsort((files, tris))
+        tris, files = tris[order], files[order]
+        seg = (self.db.execute("SELECT MAX(seg) FROM postings").fetchone()[0] or 0) + 1
+        bounds = np.flatnonzero(np.diff(tris)) + 1
+        starts = np.concatenate([[0], bounds])
+        ends = np.concatenate([bounds, [len(tris)]])
+        self.db.executemany(
+            "INSERT INTO postings VALUES (?, ?, ?)",
+            ((int(tris[s]), seg, files[s:e].tobytes()) for s, e in zip(starts, ends)),
+        )
+        self.pending, self.pending_size = [], 0
+
+    def _merge(self, batch: int = 4096):
+        """Merge all segments into one, dropping postings of files that are gone.
+
+        Works through the trigram space a range at a time to bound memory.
+        """
+        live = np.array([r[0] for r in self.db.execute("SELECT id FROM files")], dtype=_ID)
+        seg = (self.db.execute("SELECT MAX(seg) FROM postings").fetchone()[0] or 0) + 1
+        lo = -1
+        while True:
+            tris = [r[0] for r in self.db.execute(
+                "SELECT DISTINCT tri FROM postings WHERE tri > ? ORDER BY tri LIMIT ?", (lo, batch)
+            )]
+            if not tris:
+                return
+            hi = tris[-1]
+            groups: Dict[int, list] = {}
+            for tri, blob in self.db.execute("SELECT tri, files FROM postings WHERE tri > ? AND tri <= ?", (lo, hi)):
+                groups.setdefault(tri, []).append(_decode(blob))
+            self.db.execute("DELETE FROM postings WHERE tri > ? AND tri <= ?", (lo, hi))
+            merged = []
+            for tri, arrays in groups.items():
+                ids = np.unique(np.concatenate(arrays))
+                ids = ids[np.isin(ids, live)]
+                if len(ids):
+                    merged.append((tri, seg, ids.tobytes()))
+            self.db.executemany("INSERT INTO postings VALUES (?, ?, ?)", merged)
+            lo = hi
+
+    # search
+
+    def _files_with(self, tri: int) -> np.ndarray:
+        blobs = [r[0] for r in self.db.execute("SELECT files FROM postings WHERE tri = ?", (tri,))]
+        if not blobs:
+            return np.empty(0, dtype=_ID)
+        return np.unique(np.concatenate([_decode(b) for b in blobs]))
+
+    def _eval(self, q) -> Optional[np.ndarray]:
+        """File ids satisfying q; None means no constraint (every file)."""
+        if q == _ALL:
+            return None
+        if q[0] == "tri":
+            return self._files_with(q[1])
+        if q[0] == "and":
+            out = None
+            for part in q[1]:
+                ids = self._eval(part)
+                if ids is None:
+                    continue
+                out = ids if out is None else np.intersect1d(out, ids, assume_unique=True)
+                if not len(out):
+                    break
+            return out
+        results = [self._eval(part) for part in q[1]]
+        if any(r is None for r in results):
+            return None
+        return np.unique(np.concatenate(results)) if results else np.empty(0, dtype=_ID)
+
+    def candidates(self, pattern: str, flags: int = 0) -> List[str]:
+        """Paths of indexed files that may match pattern."""
+        with self.lock:
+            ids = self._eval(regex_query(pattern, flags))
+            if ids is None:
+                return [r[0] for r in self.db.execute("SELECT path FROM files ORDER BY path")]
+            out = []
+            for i in range(0, len(ids), 500):
+                part = [int(x) for x in ids[i:i + 500]]
+                out += [r[0] for r in self.db.execute(f"SELECT path FROM files WHERE id IN ({','.join('?' * len(part))})", part)]
+            return sorted(out)
+
+    def grep(self, pattern: str, flags: int = 0, accept: Callable[[str], bool] = None, limit: int = 200) -> List[GrepHit]:
+        """Lines matching pattern in indexed files, narrowed by trigrams and verified with re.
+
+        accept(path) restricts the files searched.
+        """
+        rx = re.compile(pattern, flags | re.MULTILINE)
+        out = []
+        for path in self.candidates(pattern, flags):
+            if accept is not None and not accept(path):
+                continue
+            try:
+                text = read_file(path)
+            except OSError:
+                continue
+            line, pos, line_end = 1, 0, -1
+            for m in rx.finditer(text):
+                if m.start() <= line_end:
+                    # one hit per line
+                    continue
+                line += text.count("\n", pos, m.start())
+                pos = m.start()
+                line_start = text.rfind("\n", 0, pos) + 1
+                line_end = text.find("\n", pos)
+                if line_end == -1:
+                    line_end = len(text)
+                out.append((path, line, text[line_start:line_end]))
+                if len(out) >= limit:
+                    return out
+        return out
+
+
+_indexes: Dict[str, TrigramIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_trigram_index(code_dir: str = CODE_DIR) -> TrigramIndex:
+    """Return the trigram index stored in the code root's index dir."""
+    path = os.path.join(get_index_dir(code_dir), TRIGRAM_FILE)
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = TrigramIndex(path)
+        return _indexes[path]
@@ -1,5 +1,6 @@
-# File I/O helpers (get_code_files, read_file, write_file, chunk_text)
-import os, glob
+# File I/O helpers (get_code_files, walk_code_tree, read_file, write_file, format_location, parse_location)
+import os, re
+from config import IGNORE_DIRS, IGNORE_FILES, MAX_FILE_BYTES
 
 # ANSI color codes
 def _ansi(code: str) -> str:
@@ -27,11 +28,272 @@ def blue(text: str) -> str:
     return color(text, '34')
 
 
-def get_code_files(path, exts=(".py", ".js", ".cpp", ".java", ".ts")):
-    files = []
-    for ext in exts:
-        files.extend(glob.glob(os.path.join(path, f"**/*{ext}"), recursive=True))
-    return files
+def format_location(path, start=None, end=None):
+    """Render a hit as 'path:start-end' (or 'path:line' / 'path' when lines are unknown)."""
+    if not path or not start:
+        return path
+    if not end or end == start:
+        return f"{path}:{start}"
+    return f"{path}:{start}-{end}"
+
+
+_LOCATION_RE = re.compile(r"^(.*):(\d+)(?:-(\d+))?$")
+
+def parse_location(location):
+    """Inverse of format_location: (path, start, end), with None lines when there are none."""
+    m = _LOCATION_RE.match(location or "")
+    if not m:
+        return location, None, None
+    start = int(m.group(2))
+    return m.group(1), start, int(m.group(3) or start)
+
+
+# extension -> language name stored with every chunk
+LANGUAGES = {
+    ".py": "python", ".pyi": "python", ".js": "javascript", ".jsx": "javascript",
+    ".ts": "typescript", ".tsx": "typescript", ".java": "java", ".c": "c", ".h": "c",
+    ".cc": "cpp", ".cpp": "cpp", ".cxx": "cpp", ".hpp": "cpp", ".hh": "cpp", ".rs": "rust",
+    ".go": "go", ".cs": "csharp", ".kt": "kotlin", ".swift": "swift", ".scala": "scala",
+}
+
+# extensions indexed by default: every language above, so C headers, Rust, Go, ... get chunks,
+# symbols and BM25/trigram entries too
+CODE_EXTS = tuple(LANGUAGES)
+
+
+def glob_to_regex(pat: str) -> str:
+    out = []
+    i, n = 0, len(pat)
+    while i < n:
+        if pat.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pat.startswith("/**", i) and i + 3 == n:
+            out.append("/.*")
+            i += 3
+        elif pat[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pat[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pat[i] == "[":
+            j = pat.find("]", i + 1)
+            if j == -1:
+                out.append(re.escape(pat[i]))
+                i += 1
+            else:
+                body = pat[i + 1:j]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = j + 1
+        else:
+            out.append(re.escape(pat[i]))
+            i += 1
+    return "".join(out)
+
+
+class _IgnoreRules:
+    """Patterns from one .gitignore/.diverignore, matched relative to its directory."""
+
+    def __init__(self, base: str, lines):
+        # absolute, so candidates can be made relative by slicing instead of os.path.relpath
+        self.prefix = os.path.join(os.path.abspath(base), "")
+        self.rules = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.strip("/") if dir_only else line
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if not line:
+                continue
+            rx = glob_to_regex(line)
+            rx = ("^" if anchored else "(?:^|.*/)") + rx + "$"
+            self.rules.append((re.compile(rx), negate, dir_only))
+
+    @classmethod
+    def load(cls, dirpath: str):
+        rules = []
+        for name in IGNORE_FILES:
+            try:
+                with open(os.path.join(dirpath, name), "r", encoding="utf-8", errors="replace") as f:
+                    rules.extend(f.readlines())
+            except OSError:
+                continue
+        return cls(dirpath, rules) if rules else None
+
+    def match(self, abspath: str, is_dir: bool):
+        """True/False if a rule decides, None if no rule matches."""
+        if not abspath.startswith(self.prefix):
+            return None
+        rel = abspath[len(self.prefix):].replace(os.sep, "/")
+        result = None
+        for rx, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if rx.match(rel):
+                result = not negate
+        return result
+
+
+def _ignored(rules, abspath: str, is_dir: bool) -> bool:
+    ignored = False
+    for r in rules:
+        m = r.match(abspath, is_dir)
+        if m is not None:
+            ignored = m
+    return ignored
+
+
+def _ancestor_rules(root: str):
+    """Ignore files above root up to the enclosing git checkout (outermost first).
+
+    Empty when root is a checkout itself; .git may be a directory or, for
+    worktrees and submodules, a file.
+    """
+    rules = []
+    d = os.path.abspath(root)
+    while not os.path.exists(os.path.join(d, ".git")):
+        parent = os.path.dirname(d)
+        if parent == d:
+            break
+        d = parent
+        r = _IgnoreRules.load(d)
+        if r:
+            rules.append(r)
+    return rules[::-1]
+
+
+def _is_binary(fp: str) -> bool:
+    try:
+        with open(fp, "rb") as f:
+            return b"\0" in f.read(1024)
+    except OSError:
+        return True
+
+
+def _skip_dir(path: str, abspath: str, rules) -> bool:
+    """Whether the walk prunes this directory (IGNORE_DIRS, virtualenvs, ignore rules)."""
+    if os.path.basename(abspath) in IGNORE_DIRS or os.path.exists(os.path.join(path, "pyvenv.cfg")):
+        return True
+    return bool(rules) and _ignored(rules, abspath, True)
+
+
+def _skip_file(path: str, abspath: str, rules, exts, max_size: int, skip_binary: bool) -> bool:
+    """Whether the walk leaves out this file (extension, ignore rules, size cap, binary content)."""
+    if not abspath.lower().endswith(exts):
+        return True
+    if rules and _ignored(rules, abspath, False):
+        return True
+    try:
+        if max_size and os.stat(path).st_size > max_size:
+            return True
+    except OSError:
+        return True
+    return skip_binary and _is_binary(path)
+
+
+def walk_code_tree(path, exts=None, max_size=None, skip_binary=True, dirs=False):
+    """Single-pass walk of a code root with os.scandir.
+
+    Yields file paths matching `exts` (or, with dirs=True, the directories that
+    would be descended into). Directories in IGNORE_DIRS, virtualenvs, and
+    anything matched by .gitignore/.diverignore files (in the tree or above it up
+    to the git checkout; none above a root that is a checkout) are pruned without
+    being entered. Files larger than
+    max_size bytes (default MAX_FILE_BYTES) or that look binary are skipped.
+    """
+    exts = tuple(e.lower() for e in (exts or CODE_EXTS))
+    max_size = MAX_FILE_BYTES if max_size is None else max_size
+    stack = [(path, _ancestor_rules(path))]
+    while stack:
+        dirpath, rules = stack.pop()
+        local = _IgnoreRules.load(dirpath)
+        if local:
+            rules = rules + [local]
+        if dirs:
+            yield dirpath
+        absdir = os.path.join(os.path.abspath(dirpath), "")
+        try:
+            entries = sorted(os.scandir(dirpath), key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if not _skip_dir(entry.path, absdir + entry.name, rules):
+                    subdirs.append((entry.path, rules))
+                continue
+            if dirs or _skip_file(entry.path, absdir + entry.name, rules, exts, max_size, skip_binary):
+                continue
+            yield entry.path
+        # keep a depth-first, name-sorted order
+        stack.extend(reversed(subdirs))
+
+
+class CodeFileFilter:
+    """walk_code_tree's test for single files of a root, for paths that did not come from a walk.
+
+    filter(path) is True when a walk of root would yield path, filter.enters(d) when
+    it would descend into d. The rules in effect per directory are cached; call
+    clear() when an ignore file changes.
+    """
+
+    def __init__(self, root: str, exts=None, max_size=None, skip_binary=True):
+        self.root = os.path.abspath(root)
+        self.exts = tuple(e.lower() for e in (exts or CODE_EXTS))
+        self.max_size = MAX_FILE_BYTES if max_size is None else max_size
+        self.skip_binary = skip_binary
+        self.clear()
+
+    def clear(self):
+        self._rules = {}
+
+    def _dir_rules(self, d: str):
+        """Rules in effect inside directory d, or None when the walk never enters d."""
+        if d in self._rules:
+            return self._rules[d]
+        if d == self.root:
+            rules = _ancestor_rules(d)
+        elif d.startswith(os.path.join(self.root, "")):
+            rules = self._dir_rules(os.path.dirname(d))
+            if rules is not None and _skip_dir(d, d, rules):
+                rules = None
+        else:
+            rules = None
+        if rules is not None:
+            local = _IgnoreRules.load(d)
+            if local:
+                rules = rules + [local]
+        self._rules[d] = rules
+        return rules
+
+    def enters(self, d: str) -> bool:
+        """Whether a walk of root descends into directory d."""
+        return self._dir_rules(os.path.abspath(d)) is not None
+
+    def __call__(self, path: str) -> bool:
+        abspath = os.path.abspath(path)
+        rules = self._dir_rules(os.path.dirname(abspath))
+        if rules is None:
+            return False
+        return not _skip_file(path, abspath, rules, self.exts, self.max_size, self.skip_binary)
+
+
+def get_code_files(path, exts=CODE_EXTS, skip_binary=True):
+    """Return code files under path in one ignore-aware pass (see walk_code_tree)."""
+    return list(walk_code_tree(path, exts, skip_binary=skip_binary))
 
 def read_file(fp):
     try:
@@ -44,8 +306,3 @@ def write_file(fp, content):
     with open(fp, "w", encoding="utf-8") as f:
         f.write(content)
     print(f"Updated {fp}")
-
-def chunk_text(text, size=512):
-    lines = text.splitlines()
-    for i in range(0, len(lines), size):
-        yield "\n".join(lines[i:i+size])
@@ -0,0 +1,49 @@
+# Background warm-up of the index, vector stores and embedding model for a fast CLI start
+import threading
+import time
+from config import SEARCH_MODE
+from typing import Optional
+
+
+class Warmup:
+    """Loads what retrieval needs on a daemon thread so the prompt is usable right away.
+
+    Runs indexer.index_workspace() (opens every root's store, rebuilds empty or
+    stale ones and, through the manifest diff, catches up on files added, changed
+    or removed while the CLI was not running), then loads the embedding model
+    with one tiny encode unless retrieval is lexical-only. Commands that search
+    wait() first; :run, :edit and shell commands never do.
+    """
+
+    def __init__(self, load_model: bool = SEARCH_MODE != "lexical"):
+        self.load_model = load_model
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.elapsed: Optional[float] = None
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            from indexer import index_workspace
+
+            # incremental: only a manifest diff when nothing changed since the last run
+            index_workspace()
+            if self.load_model:
+                from encoder import encode
+
+                encode(["warm up"], use_cache=False)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.elapsed = time.perf_counter() - start
+            self.done.set()
+
+    def ready(self) -> bool:
+        return self.done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self.done.wait(timeout)
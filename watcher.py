@@ -0,0 +1,224 @@
+# Background file watcher that keeps the index live while the CLI runs
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import time
+from config import CODE_DIR, IGNORE_FILES, WATCH_DEBOUNCE, WATCH_POLL_INTERVAL
+from indexer import index_paths
+from utils import CODE_EXTS, CodeFileFilter, get_code_files, walk_code_tree
+from typing import Dict, Optional
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_EVENT = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Minimal ctypes binding for Linux inotify, watching a directory tree."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._add.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs: Dict[int, str] = {}
+
+    def add_tree(self, root: str):
+        for d in walk_code_tree(root, dirs=True):
+            wd = self._add(self.fd, os.fsencode(d), _WATCH_MASK)
+            if wd >= 0:
+                self.dirs[wd] = d
+
+    def read(self):
+        """Yield (path, is_dir) for pending events; (None, False) means the queue overflowed."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        i = 0
+        while i + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, i)
+            name = data[i + _EVENT.size:i + _EVENT.size + length].rstrip(b"\0")
+            i += _EVENT.size + length
+            if mask & _IN_Q_OVERFLOW:
+                yield None, False
+                continue
+            d = self.dirs.get(wd)
+            if d is None or not name:
+                continue
+            yield os.path.join(d, os.fsdecode(name)), bool(mask & _IN_ISDIR)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    """Watches a code root (CODE_DIR by default) and re-indexes changed files in the background.
+
+    Changes are collected into `pending` and dispatched once no new event arrived
+    for WATCH_DEBOUNCE seconds; the batch then runs through `indexer.index_paths`
+    on a worker thread so the prompt never blocks. Uses inotify where available
+    and falls back to polling every WATCH_POLL_INTERVAL seconds.
+    """
+
+    def __init__(self, root: str = CODE_DIR):
+        self.root = root
+        # the walk's own test (extension, ignore files, size cap, binary), for single paths
+        self.accepts = CodeFileFilter(root)
+        self.mode = None
+        self.pending = set()
+        self.in_flight = []
+        self.last_result = None
+        self.last_error: Optional[str] = None
+        self.last_run: Optional[float] = None
+        self._last_event = 0.0
+        self._changed = None
+        self._inotify = None
+        self._tasks = []
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        try:
+            self._inotify = _Inotify()
+            self._inotify.add_tree(self.root)
+            loop.add_reader(self._inotify.fd, self._on_inotify)
+            self.mode = "inotify"
+        except (OSError, AttributeError, NotImplementedError):
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+            self._tasks.append(loop.create_task(self._poll()))
+            self.mode = "polling"
+        self._tasks.append(loop.create_task(self._dispatch()))
+
+    def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        self._tasks = []
+        if self._inotify is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self._inotify.fd)
+            except Exception:
+                pass
+            self._inotify.close()
+            self._inotify = None
+
+    def notify(self, path: str):
+        """Queue a file for re-indexing if a walk of the root would index it (or it was deleted)."""
+        if os.path.basename(path) in IGNORE_FILES:
+            # rules changed: files they now exclude are dropped by the next :index
+            self.accepts.clear()
+            return
+        if not path.lower().endswith(CODE_EXTS):
+            return
+        if os.path.exists(path) and not self.accepts(path):
+            return
+        self._queue(path)
+
+    def _queue(self, path: str):
+        self.pending.add(path)
+        self._last_event = time.monotonic()
+        if self._changed is not None:
+            self._changed.set()
+
+    def status(self) -> dict:
+        return {
+            "mode": self.mode,
+            "pending": sorted(self.pending),
+            "in_flight": list(self.in_flight),
+            "last_result": self.last_result,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+        }
+
+    def _on_inotify(self):
+        for path, is_dir in self._inotify.read():
+            if path is None:
+                # events were dropped: let the manifest diff sort out what changed
+                self._scan(self.root)
+            elif is_dir:
+                # watch new directories and pick up files created before the watch existed
+                if os.path.isdir(path):
+                    self._scan(path, watch=True)
+            else:
+                self.notify(path)
+
+    def _scan(self, path: str, watch: bool = False):
+        """Walk path on a worker thread (adding watches first when watch) and queue its code files."""
+        self._tasks = [t for t in self._tasks if not t.done()]
+        self._tasks.append(asyncio.get_running_loop().create_task(self._scan_tree(path, watch)))
+
+    async def _scan_tree(self, path: str, watch: bool):
+        inotify = self._inotify
+
+        def walk():
+            if not self.accepts.enters(path):
+                return []
+            if watch and inotify is not None:
+                inotify.add_tree(path)
+            return get_code_files(path)
+
+        try:
+            files = await asyncio.to_thread(walk)
+        except OSError:
+            # the watcher was stopped (or the directory vanished) mid-walk
+            return
+        # the walk already applied the ignore rules, size cap and binary check
+        for fp in files:
+            self._queue(fp)
+
+    def _snapshot(self) -> Dict[str, tuple]:
+        snap = {}
+        # no binary sniffing here: the snapshot only needs stat data and runs every interval
+        for fp in get_code_files(self.root, skip_binary=False):
+            try:
+                st = os.stat(fp)
+            except OSError:
+                continue
+            snap[fp] = (st.st_size, st.st_mtime_ns)
+        return snap
+
+    async def _poll(self):
+        before = await asyncio.to_thread(self._snapshot)
+        while True:
+            await asyncio.sleep(WATCH_POLL_INTERVAL)
+            after = await asyncio.to_thread(self._snapshot)
+            for fp in set(before) | set(after):
+                if before.get(fp) != after.get(fp):
+                    self.notify(fp)
+            before = after
+
+    async def _dispatch(self):
+        while True:
+            await self._changed.wait()
+            # debounce: wait until the burst of events has settled
+            while True:
+                delay = self._last_event + WATCH_DEBOUNCE - time.monotonic()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self._changed.clear()
+            if not self.pending:
+                continue
+            self.in_flight = sorted(self.pending)
+            self.pending.clear()
+            try:
+                self.last_result = await asyncio.to_thread(index_paths, self.in_flight, root=self.root)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+            finally:
+                self.last_run = time.time()
+                self.in_flight = []